@@ -1,93 +1,188 @@
 import os
 import json
-from flask import Flask, request, jsonify
+import time
+from flask import Flask, Response, request, jsonify, stream_with_context, g
 from flask_cors import CORS
 from dotenv import load_dotenv
 
-# TODO: Uncomment and configure when integrating real Gemini API
-import google.generativeai as genai
-
-# Load environment variables from .env file
+# Load environment variables from .env file (before the modules below read their config)
 load_dotenv()
 
+from session_store import build_session_store, new_session_id
+from streaming import IncrementalFieldParser, sse_event
+from llm_gateway import AsyncLLMGateway, LLMOverloaded
+from llm_client import build_llm_client
+from call_policy import CallPolicy, LLMUnavailable, LLMDeadlineExceeded
+from model_router import ModelRouter
+from response_cache import ResponseCache, profile_key
+from prefetch import Prefetcher
+from single_flight import build_single_flight, prompt_key
+from batch_jobs import BatchJobs, new_job_id, BATCH_MAX_PROFILES
+from progress_store import ProgressStore, new_attempt_id, new_learner_id, ATTEMPT_STATUSES
+from history import record_turn, render_history, turn_count
+from prompts import (PROMPT_VERSION, learning_paths_prompt, start_quiz_prompt, submit_answer_prompt,
+                     render_profile_block, repair_prompt)
+from response_parsing import ResponseParseError, parse_model_output, LLM_REPAIR_RETRY
+from telemetry import get_logger, span, start_trace, finish_trace, resumed, render_metrics, LOG_PROMPTS
+from response_encoding import compress_response, wants_lean, lean_payload, drop_nulls, unsent_fields
+
 app = Flask(__name__) # app = Flask(__name__, static_folder='frontend_build', static_url_path='')
 CORS(app)  # Enable CORS for all routes
 
-MEMORY_FILE = "memory.json"
+log = get_logger("app")
+
+# Per-session state (replaces the old shared memory.json)
+session_store = build_session_store()
+
+# Learning paths depend only on the profile, so near-identical profiles share them
+paths_cache = ResponseCache()
+PATHS_CACHE_NAMESPACE = f"paths:{PROMPT_VERSION}" # Changes with the prompt templates
+
+# Concurrent identical prompts share one model call (SINGLE_FLIGHT=off|process|shared)
+single_flight = build_single_flight()
 
 # --- Helper Functions ---
 
-def read_memory():
-    """Reads data from the memory file."""
-    try:
-        if os.path.exists(MEMORY_FILE):
-            with open(MEMORY_FILE, 'r') as f:
-                content = f.read()
-                if not content:
-                    return {} # Return empty dict if file is empty
-                return json.loads(content)
-        else:
-            return {} # Return empty dict if file doesn't exist
-    except (IOError, json.JSONDecodeError) as e:
-        print(f"Error reading memory file: {e}")
-        return {} # Return empty dict on error
+def get_session_id():
+    """Returns the session id sent by the client (header or query string)."""
+    return request.headers.get('X-Session-Id') or request.args.get('session_id')
 
-def write_memory(data):
-    """Writes data to the memory file."""
-    try:
-        with open(MEMORY_FILE, 'w') as f:
-            json.dump(data, f, indent=4)
-    except IOError as e:
-        print(f"Error writing memory file: {e}")
+def get_learner_id():
+    """Returns the learner id sent by the client (header or query string), if any."""
+    return request.headers.get('X-Learner-Id') or request.args.get('learner_id')
+
+def learner_id_for(session_id, *candidates):
+    """
+    The first usable learner id among candidates, else a new one. Learner ids
+    are listed publicly, so one equal to a session id is never accepted.
+    """
+    for candidate in candidates:
+        if isinstance(candidate, str) and candidate and candidate != session_id:
+            return candidate
+    return new_learner_id()
+
+def missing_session_response():
+    """Standard 400 returned when a request doesn't carry a session id."""
+    return jsonify({"status": "error", "message": "Missing session id. Please submit the form first."}), 400
+
+def success_response(**fields):
+    """Success body; lean (no nulls or message) when the client sent Prefer: return=minimal."""
+    payload = {"status": "success", **fields}
+    if wants_lean(request):
+        response = jsonify(lean_payload(payload))
+        response.headers['Preference-Applied'] = 'return=minimal'
+    else:
+        response = jsonify(payload)
+    response.vary.add('Prefer')
+    return response
+
+def conditional_response(response):
+    """Adds a weak ETag (valid for every encoding) and answers a matching If-None-Match with 304."""
+    response.add_etag(weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache' # Per-session: browsers revalidate, proxies don't store
+    return response.make_conditional(request)
+
+def log_model_text(label, prompt_name, text):
+    """Full prompt/reply dump with LOG_PROMPTS=1, otherwise a one-line debug record."""
+    if LOG_PROMPTS:
+        log.info("%s (%s):\n%s", label, prompt_name, text)
+    else:
+        log.debug("%s (%s): %d chars", label, prompt_name, len(text))
+
+# --- Request Tracing (see telemetry.py) ---
+
+@app.before_request
+def begin_request_trace():
+    g.trace = start_trace(request.endpoint or "unmatched")
+
+@app.after_request
+def record_response_status(response):
+    g.status = response.status_code
+    return response
+
+@app.after_request
+def encode_response(response):
+    with span("compress"):
+        return compress_response(response, request.headers.get('Accept-Encoding'))
+
+@app.teardown_request
+def end_request_trace(exc):
+    # Streamed bodies are sent after teardown; stream_interaction records those traces itself
+    finish_trace(g.pop('trace', None), g.pop('status', 500))
 
 # --- AI Simulation ---
 
+# Configured once per worker from GEMINI_API_KEY / GEMINI_MODEL (LLM_BACKEND=mock for offline benchmarks)
+gemini_client = build_llm_client()
+
+# Which model each call goes to (LLM_ROUTING=off|rules|ab), with per-route latency, cost and parse stats
+model_router = ModelRouter(gemini_client.model_name)
+
+# Deadlines, retries, hedging and the circuit breaker for every model call
+call_policy = CallPolicy(gemini_client.generate_async, gemini_client.stream_async)
+
+# One shared event loop per worker multiplexes every in-flight model call
+llm_gateway = AsyncLLMGateway(call_policy.generate, call_policy.stream)
+
+def overloaded_response(e):
+    """429/503 returned when the LLM gateway sheds load."""
+    response = jsonify({"status": "error", "message": e.message})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, e.status_code
+
+def clean_ai_text(text):
+    """Strips markdown code fences the model sometimes wraps around its JSON."""
+    cleaned_text = text.strip()
+    if cleaned_text.startswith('```json'):
+        cleaned_text = cleaned_text[7:].strip() # Remove ```json and surrounding whitespace
+    elif cleaned_text.startswith('```'): # Handle case where it might just start with ```
+         cleaned_text = cleaned_text[3:].strip()
+    if cleaned_text.endswith('```'):
+        cleaned_text = cleaned_text[:-3].strip() # Remove ``` and surrounding whitespace
+    return cleaned_text
+
 def call_gemini_api(prompt):
     """
     Calls the actual Google Gemini API.
     Replace this with actual API calls when ready.
     """
-    print("\n--- Calling Real Gemini API ---")
-    print(f"PROMPT:\n{prompt}")
-    print("------------------------------\n")
+    prompt_name = getattr(prompt, 'name', 'prompt')
+    log_model_text("Prompt", prompt_name, str(prompt))
 
     ### START AI API CALL PLACEHOLDER ###
     # TODO: Integrate Google Gemini API here
     try:
-        # 1. Configure the API key (ideally loaded securely)
-        api_key = "INSERT YOUR API KEY HERE"
-        if not api_key:
-            print("Error: GEMINI_API_KEY not found in environment variables.")
+        # 1. The client is configured once at startup from GEMINI_API_KEY
+        if not gemini_client.api_key:
+            log.error("GEMINI_API_KEY not found in environment variables.")
             # Handle error appropriately, maybe return a default error JSON
             # Return JSON string directly, as the caller expects a string
             return json.dumps({"status": "error", "message": "API key not configured"})
-        genai.configure(api_key=api_key)
 
-        # 2. Create a GenerativeModel instance
-        # Using gemini-1.5-flash-latest as requested
-        model = genai.GenerativeModel('gemini-2.0-flash')
-
-        # 3. Generate content
-        response = model.generate_content(prompt)
+        # 2. Generate content on the shared gateway loop (bounded concurrency)
+        with span("model_call"):
+            started = time.perf_counter()
+            try:
+                response_text = llm_gateway.call(prompt)
+            except Exception:
+                model_router.record_call(prompt, time.perf_counter() - started, error=True)
+                raise
+            model_router.record_call(prompt, time.perf_counter() - started, response_text)
 
         # --- Response Cleaning (Crucial!) ---
         # Remove potential markdown backticks and 'json' identifier
-        cleaned_text = response.text.strip()
-        if cleaned_text.startswith('```json'):
-            cleaned_text = cleaned_text[7:].strip() # Remove ```json and surrounding whitespace
-        elif cleaned_text.startswith('```'): # Handle case where it might just start with ```
-             cleaned_text = cleaned_text[3:].strip()
-        if cleaned_text.endswith('```'):
-            cleaned_text = cleaned_text[:-3].strip() # Remove ``` and surrounding whitespace
+        cleaned_text = clean_ai_text(response_text)
 
         # Assuming the response contains the JSON string directly in response.text
         # You might need to adjust parsing based on the actual Gemini response structure
         # Return the cleaned string, let the endpoint handle JSON parsing
-        print(f"RAW AI RESPONSE (Cleaned):\n{cleaned_text}")
+        log_model_text("Raw AI response (cleaned)", prompt_name, cleaned_text)
         return cleaned_text
 
+    except LLMOverloaded:
+        raise # Endpoints turn this into 429/503/504 (backpressure, open circuit, deadline)
     except Exception as e:
-        print(f"Error calling Gemini API: {e}")
+        log.error("Error calling Gemini API (%s): %s", prompt_name, e)
         # Return an error JSON string that the calling function can parse
         return json.dumps({"status": "error", "message": f"AI API call failed: {e}"})
 
@@ -113,55 +208,311 @@ def call_gemini_api(prompt):
     # print(f"SIMULATED RESPONSE:\n{simulated_response_json_string}")
     # return simulated_response_json_string
 
+def call_gemini_api_stream(prompt):
+    """
+    Streaming variant of call_gemini_api: yields raw text chunks as the model
+    produces them. Errors are raised to the caller, which reports them as an
+    SSE 'error' event.
+    """
+    log_model_text("Prompt (stream)", getattr(prompt, 'name', 'prompt'), str(prompt))
+    started = time.perf_counter()
+    chunks = []
+    try:
+        for chunk in llm_gateway.stream(prompt):
+            chunks.append(chunk)
+            yield chunk
+    except Exception:
+        model_router.record_call(prompt, time.perf_counter() - started, error=True)
+        raise
+    model_router.record_call(prompt, time.perf_counter() - started, "".join(chunks))
+
+def stream_interaction(prompt, endpoint, finalize):
+    """
+    Streams a model reply to the client as server-sent events:
+      material -- {"delta": "..."} as the material text arrives
+      field    -- {"name": ..., "value": ...} once each top-level field completes
+      done     -- {"status": "success", "interaction": {...}} after finalize() stored it
+      error    -- {"status": "error", "message": "..."}
+    finalize(interaction) validates/persists the parsed object and may raise ValueError.
+    Lean clients get no null fields, and "done" only carries fields that
+    differ from what was already sent.
+    """
+    trace = g.pop('trace', None) # Finished by generate(), when the stream ends
+    lean = wants_lean(request)
+
+    def generate():
+        with resumed(trace):
+            yield from send_events()
+
+    def send_events():
+        parser = IncrementalFieldParser(stream_keys=("material",))
+        chunks = []
+        sent = {}
+        try:
+            with span("model_call"): # Includes sending the events, as the client reads them
+                for chunk in call_gemini_api_stream(prompt):
+                    chunks.append(chunk)
+                    for kind, key, value in parser.feed(chunk):
+                        if kind == "delta":
+                            yield sse_event("material", {"delta": value})
+                        elif not (lean and value is None):
+                            sent[key] = value
+                            yield sse_event("field", {"name": key, "value": value})
+
+            with span("parse_response"):
+                raw_text = clean_ai_text("".join(chunks))
+                log_model_text("Raw AI response (cleaned)", prompt.name, raw_text)
+                try:
+                    interaction = parse_model_output(raw_text, prompt.schema) # Local repair only; deltas already went out
+                except ResponseParseError:
+                    model_router.record_parse(prompt, "failed")
+                    raise
+                model_router.record_parse(prompt, "ok")
+                if not isinstance(interaction, dict):
+                    raise ValueError("AI response was not an object.")
+            with span("state_write"):
+                finalize(interaction)
+        except LLMOverloaded as e:
+            yield sse_event("error", {"status": "error", "message": e.message, "retry_after": e.retry_after})
+            return
+        except (json.JSONDecodeError, ValueError) as e:
+            log.warning("Error decoding/validating streamed AI response (%s): %s", endpoint, e)
+            yield sse_event("error", {"status": "error", "message": f"Failed to parse or validate AI response ({endpoint})."})
+            return
+        except Exception as e:
+            log.error("Error streaming /api/%s: %s", endpoint, e)
+            yield sse_event("error", {"status": "error", "message": f"AI API call failed: {e}"})
+            return
+
+        yield done_event(interaction, sent if lean else None)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def done_event(interaction, sent=None):
+    """The final "done" event; given the fields already sent (lean mode), it carries only what changed."""
+    if sent is None:
+        return sse_event("done", {"status": "success", "interaction": interaction})
+    changed = unsent_fields(interaction, sent)
+    return sse_event("done", {"status": "success", **({"interaction": changed} if changed else {})})
+
+# --- Response Parsing ---
+
+class AIServiceError(Exception):
+    """The model call itself failed (call_gemini_api returned its error JSON)."""
+
+def ai_error_message(response_str):
+    """Message of the {"status": "error"} reply call_gemini_api returns for a failed call, else None."""
+    if '"status": "error"' not in response_str:
+        return None
+    try:
+        value = json.loads(response_str)
+    except json.JSONDecodeError:
+        return None
+    if isinstance(value, dict) and value.get("status") == "error":
+        return value.get('message', 'AI processing error')
+    return None
+
+def parse_ai_response(response_str, prompt):
+    """
+    Parses a model reply against prompt.schema. Malformed JSON is repaired
+    locally; if that still fails, one small repair call is made (LLM_REPAIR_RETRY).
+    Raises AIServiceError or ResponseParseError.
+    """
+    message = ai_error_message(response_str)
+    if message:
+        raise AIServiceError(message)
+    try:
+        with span("parse_response"):
+            value = parse_model_output(response_str, prompt.schema)
+    except ResponseParseError as e:
+        if not (LLM_REPAIR_RETRY and prompt.schema):
+            model_router.record_parse(prompt, "failed")
+            raise
+        log.info("Repairing AI response (%s): %s %s", prompt.name, e, e.errors)
+        fix = model_router.route(repair_prompt(response_str, prompt.schema, e.errors),
+                                 arm=prompt.route.arm if prompt.route else None)
+        repaired_str = call_gemini_api(fix)
+        try:
+            if ai_error_message(repaired_str):
+                raise e
+            with span("parse_response"):
+                value = parse_model_output(repaired_str, prompt.schema)
+        except ResponseParseError:
+            model_router.record_parse(prompt, "failed")
+            raise
+        model_router.record_parse(prompt, "repaired")
+        return value
+    model_router.record_parse(prompt, "ok")
+    return value
+
+# --- Interaction Helpers ---
+
+def get_profile_block(state):
+    """The session's serialized profile, rendered once in analyze_form (rebuilt for older sessions)."""
+    return state.get('profile_block') or render_profile_block(state['analysis'])
+
+def route_prompt(prompt, session_id=None, state=None):
+    """Picks the prompt's model (see model_router.py) from its template, the learner and the turn."""
+    state = state or {}
+    return model_router.route(prompt, key=session_id,
+                              familiarity=(state.get('analysis') or {}).get('familiarity_level'),
+                              turns=turn_count(state.get('history')))
+
+def build_submit_answer_prompt(session_id, state, user_answer):
+    """Prompt that assesses the user's answer (or continues after a summary)."""
+    # Earlier turns of this path, bounded by HISTORY_TOKEN_BUDGET
+    history_block = render_history(state.get('history'))
+    return route_prompt(submit_answer_prompt(get_profile_block(state), state['chosen_path'],
+                                             state['current_interaction'], user_answer, history_block),
+                        session_id, state)
+
+def prefetch_first_items(session_id, state, path_list):
+    """Schedules the first start_quiz item for each offered path (no-op unless prefetch is enabled)."""
+    if not prefetcher.enabled:
+        return
+    profile_block = get_profile_block(state)
+    prompts = {}
+    for path in path_list:
+        if isinstance(path, dict) and path.get('name'):
+            prompts[path['name']] = route_prompt(start_quiz_prompt(profile_block, path['name']), session_id, state)
+    prefetcher.schedule(session_id, prompts)
+
+def generate_parsed(prompt):
+    """
+    Calls the model and parses the reply; concurrent callers with the same
+    prompt wait for one call and share its result (see single_flight.py).
+    Raises like call_gemini_api / parse_ai_response.
+    """
+    def run():
+        response_str = call_gemini_api(prompt)
+        try:
+            return parse_ai_response(response_str, prompt)
+        except ResponseParseError:
+            log_model_text("Unparseable AI response", prompt.name, response_str)
+            raise
+    return single_flight.do(prompt_key(prompt), run)
+
+def fetch_first_item(prompt):
+    """Prefetch task: runs a start_quiz prompt and returns the parsed item, or None on any failure."""
+    try:
+        return generate_parsed(prompt)
+    except (AIServiceError, ResponseParseError, LLMOverloaded):
+        return None
+
+def degraded_learning_paths(analysis):
+    """Generic paths built from the profile, served while the model is unavailable."""
+    goal = analysis.get('learning_goal') or 'your goal'
+    duration = f"Approx. {analysis.get('time_available_per_session') or '15 mins'}"
+    return [
+        {"name": "Core Concepts Review", "duration": duration,
+         "overview": f"Revisit the key ideas behind {goal} and check your understanding."},
+        {"name": "Practical Example Task", "duration": duration,
+         "overview": f"Work through a short hands-on example related to {goal}."},
+        {"name": "Quick Self-Check", "duration": duration,
+         "overview": f"Answer a few quick questions to see where you stand with {goal}."},
+    ]
+
+# Optional speculative start_quiz calls for every offered path (PREFETCH_FIRST_ITEM=1)
+prefetcher = Prefetcher(fetch_first_item)
+
+def pregenerate_paths(cache_key, profile_block):
+    """Batch task: fills the paths cache for one profile. Returns "cached" or "generated"."""
+    if paths_cache.get(cache_key) is not None:
+        return "cached"
+    paths_cache.put(cache_key, generate_parsed(route_prompt(learning_paths_prompt(profile_block), cache_key)))
+    return "generated"
+
+# Cohort imports (/api/analyze_form/batch) and their path pre-generation, on a bounded pool
+batch_jobs = BatchJobs(build_session_store(table="batch_jobs"))
+
+# Every path a learner starts, with its turns and final summary, for review and resuming later
+progress_store = ProgressStore()
+
+def begin_attempt(session_id, interaction_dict):
+    """Stores the first interaction of the chosen path and opens its record in the progress index."""
+    attempt_id = new_attempt_id()
+    with session_store.update(session_id) as state:
+        state['current_interaction'] = interaction_dict
+        state['attempt_id'] = attempt_id
+        state['learner_id'] = learner_id_for(session_id, state.get('learner_id'))
+    try:
+        progress_store.start(attempt_id, state['learner_id'], state['chosen_path'],
+                             state['analysis'], interaction_dict)
+    except Exception as e:
+        # The learner can carry on; only this attempt's review/resume record is lost
+        log.error("Could not index attempt %s: %s", attempt_id, e)
+
+def store_next_step(session_id, analysis, chosen_path, next_step_dict, current_interaction, user_answer):
+    """Persists the interaction returned by submit_answer into the session and logs the answered turn."""
+    with session_store.update(session_id) as state:
+        if user_answer != "SYSTEM_CONTINUE_SIGNAL":
+            state['history'] = record_turn(state.get('history'), current_interaction.get('material'),
+                                           current_interaction.get('question_for_user'), user_answer)
+        # Store the *current* interaction state (which might be the summary screen info)
+        state['current_interaction'] = next_step_dict
+        attempt_id = state.get('attempt_id')
+        # Store chosen path and analysis if they aren't already there (should be, but safe)
+        if 'analysis' not in state: state['analysis'] = analysis
+        if 'chosen_path' not in state: state['chosen_path'] = chosen_path
+
+        # Clear specific 'final_summary' field if session is continuing
+        if not next_step_dict.get('session_finished'):
+             state.pop('final_summary', None) # Old field, potentially remove later
+        else:
+            # Store the structured summary separately if finished (optional, as it's in current_interaction)
+            state['final_summary'] = next_step_dict.get('summary')
+
+    if attempt_id: # Sessions started before the progress index have none
+        try:
+            progress_store.record_turn(attempt_id, current_interaction,
+                                       None if user_answer == "SYSTEM_CONTINUE_SIGNAL" else user_answer,
+                                       next_step_dict)
+        except Exception as e:
+            log.error("Could not index a turn of attempt %s: %s", attempt_id, e)
+
+# --- Form Validation ---
+
+# Frontend sends camelCase
+REQUIRED_FORM_FIELDS = ("goal", "familiarity", "styles", "timeAvailable", "achieveGoal", "sessionScope")
+
+def analysis_from_form(data):
+    """
+    Validates a submitted profile form and builds the analysis object stored in the session.
+    Returns (analysis, missing_fields); analysis is None when required fields are missing.
+    """
+    if not isinstance(data, dict):
+        return None, list(REQUIRED_FORM_FIELDS)
+    # Falsy values are missing, except an empty styles list (the form requires one, but it isn't an error)
+    missing = [field for field in REQUIRED_FORM_FIELDS
+               if not data.get(field) and not (field == 'styles' and isinstance(data.get(field), list))]
+    if missing:
+        return None, missing
+    analysis = {
+        "learning_goal": data['goal'],
+        "familiarity_level": data['familiarity'],
+        "preferred_styles": data['styles'],
+        "time_available_per_session": data['timeAvailable'],
+        "specific_focus_notes": data.get('specificFocus') or "None", # Handle optional field
+        "immediate_achievement_goal": data['achieveGoal'],
+        "desired_session_scope": data['sessionScope']
+    }
+    return analysis, []
+
 # --- API Endpoints ---
 
 @app.route('/api/analyze_form', methods=['POST'])
 def analyze_form():
     """Agent 1: Analyzes the initial user form and stores analysis."""
     try:
-        data = request.get_json()
-        print("Received form data:", data) # Debugging: Print received data
-
-        # --- Extract all fields from the request ---
-        goal = data.get('goal')
-        familiarity = data.get('familiarity')
-        styles = data.get('styles')
-        time_available = data.get('timeAvailable') # Frontend sends camelCase
-        specific_focus = data.get('specificFocus')
-        achieve_goal = data.get('achieveGoal') # Frontend sends camelCase
-        session_scope = data.get('sessionScope') # Frontend sends camelCase
-
-        # Basic validation (can be expanded)
-        if not all([goal, familiarity, styles, time_available, achieve_goal, session_scope]):
-             # Check if styles is an empty list, which is valid if user selected none (though form requires one)
-             if not styles and isinstance(styles, list):
-                 pass # Allow empty list for styles if validation changes later
-             else:
-                print("Validation failed. Missing fields:", {
-                    "goal": goal, "familiarity": familiarity, "styles": styles,
-                    "timeAvailable": time_available, "achieveGoal": achieve_goal,
-                    "sessionScope": session_scope
-                })
-                # Be more specific about missing fields in the error message
-                missing = [k for k, v in {
-                    "goal": goal, "familiarity": familiarity, "styles": styles,
-                    "timeAvailable": time_available, "achieveGoal": achieve_goal,
-                    "sessionScope": session_scope
-                }.items() if not v and not (k == 'styles' and isinstance(v, list))] # Check for falsy values, except empty list for styles
-                return jsonify({"status": "error", "message": f"Missing required form fields: {', '.join(missing)}"}), 400
-
-
-        # --- Construct the analysis object ---
-        # This is the object that will be stored in memory
-        analysis = {
-            "learning_goal": goal,
-            "familiarity_level": familiarity,
-            "preferred_styles": styles,
-            "time_available_per_session": time_available,
-            "specific_focus_notes": specific_focus or "None", # Handle optional field
-            "immediate_achievement_goal": achieve_goal, # Store the new field
-            "desired_session_scope": session_scope # Store the new field
-        }
+        with span("parse_request"):
+            data = request.get_json()
+        log.debug("Received form data: %s", data)
+
+        analysis, missing = analysis_from_form(data)
+        if missing:
+            log.info("Validation failed. Missing fields: %s", missing)
+            return jsonify({"status": "error", "message": f"Missing required form fields: {', '.join(missing)}"}), 400
 
         # --- AI Call (Optional for this step, but could be used for deeper analysis) ---
         # For the MVP, we might just store the structured data directly.
@@ -170,311 +521,523 @@ def analyze_form():
         # ai_analysis_summary = call_gemini_api(prompt)
         # analysis['ai_summary'] = ai_analysis_summary # Add AI's take
 
-        # --- Store analysis in memory ---
-        memory = read_memory()
-        memory['analysis'] = analysis
-        # Clear previous path/interaction if starting fresh
-        memory.pop('chosen_path', None)
-        memory.pop('current_interaction', None)
-        memory.pop('final_summary', None)
-        write_memory(memory)
-
-        print("Analysis stored:", analysis) # Debugging: Print stored analysis
-
-        return jsonify({"status": "success", "message": "Form analyzed successfully."})
+        # --- Store analysis in the session ---
+        # Reuse the caller's session if it sent one, otherwise issue a new id
+        session_id = get_session_id() or data.get('session_id') or new_session_id()
+        with span("state_write"), session_store.update(session_id) as state:
+            state['analysis'] = analysis
+            state['profile_block'] = render_profile_block(analysis) # Serialized once per session
+            # Learner id keys the progress index; a learner without one gets a fresh id
+            learner_id = state['learner_id'] = learner_id_for(session_id, get_learner_id(), data.get('learner_id'),
+                                                              state.get('learner_id'))
+            # Clear previous path/interaction if starting fresh (earlier attempts stay in the progress index)
+            state.pop('chosen_path', None)
+            state.pop('current_interaction', None)
+            state.pop('final_summary', None)
+            state.pop('attempt_id', None)
+            state.pop('history', None)
+        prefetcher.discard(session_id) # Anything prefetched was for the old profile
+
+        log.debug("Analysis stored: %s", analysis)
+
+        return success_response(message="Form analyzed successfully.", session_id=session_id, learner_id=learner_id)
 
     except json.JSONDecodeError:
         return jsonify({"status": "error", "message": "Invalid JSON data received."}), 400
     except Exception as e:
-        print(f"Error in /api/analyze_form: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error in /api/analyze_form: %s", e)
         return jsonify({"status": "error", "message": "An internal server error occurred during form analysis."}), 500
 
+def parse_batch_upload():
+    """
+    Reads a JSON array or JSON-lines body. Returns ([(item, record)], errors),
+    where item is the 1-based array position or line number.
+    """
+    body = request.get_data(as_text=True)
+    if body.lstrip().startswith('['):
+        try:
+            records = json.loads(body)
+        except json.JSONDecodeError:
+            return [], [{"item": 0, "message": "Invalid JSON array."}]
+        return list(enumerate(records, 1)), []
+    records, errors = [], []
+    for number, line in enumerate(body.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            records.append((number, json.loads(line)))
+        except json.JSONDecodeError:
+            errors.append({"item": number, "message": "Invalid JSON."})
+    return records, errors
+
+@app.route('/api/analyze_form/batch', methods=['POST'])
+def analyze_form_batch():
+    """
+    Bulk analyze_form for cohort onboarding. Validates every profile with the
+    same rules as analyze_form, stores the valid ones in one transaction and
+    returns their session ids. With ?generate_paths=1 learning paths are
+    pre-generated in the background; poll /api/analyze_form/batch/<job_id>.
+    """
+    try:
+        with span("parse_request"):
+            records, errors = parse_batch_upload()
+        if len(records) > BATCH_MAX_PROFILES:
+            return jsonify({"status": "error", "message": f"Too many profiles (max {BATCH_MAX_PROFILES} per upload)."}), 413
+        generate_paths = request.args.get('generate_paths', '').lower() in ('1', 'true', 'yes')
+
+        sessions, items, tasks = [], [], {}
+        for item, data in records:
+            analysis, missing = analysis_from_form(data)
+            if missing:
+                errors.append({"item": item, "message": f"Missing required form fields: {', '.join(missing)}"})
+                continue
+            session_id = new_session_id() # Always issued here: an upload must not overwrite existing sessions
+            profile_block = render_profile_block(analysis)
+            learner_id = learner_id_for(session_id, data.get('learner_id'))
+            items.append((session_id, {"analysis": analysis, "profile_block": profile_block, "learner_id": learner_id}))
+            sessions.append({"item": item, "session_id": session_id})
+            if generate_paths:
+                # Identical profiles share one task (and one cache entry)
+                cache_key = profile_key(PATHS_CACHE_NAMESPACE, analysis)
+                if cache_key not in tasks:
+                    tasks[cache_key] = lambda k=cache_key, b=profile_block: pregenerate_paths(k, b)
+
+        if items:
+            with span("state_write"):
+                session_store.put_many(items)
+
+        errors.sort(key=lambda e: e["item"])
+        job = batch_jobs.create(new_job_id(), {"profiles": len(items), "invalid": len(errors)}, tasks)
+        log.info("Batch import %s: %d profiles stored, %d invalid, %d path tasks",
+                 job["id"], len(items), len(errors), len(tasks))
+        return jsonify({"status": "success", "job_id": job["id"], "job": job,
+                        "sessions": sessions, "errors": errors}), 202 if tasks else 200
+
+    except Exception as e:
+        log.exception("Error in /api/analyze_form/batch: %s", e)
+        return jsonify({"status": "error", "message": "An internal server error occurred during batch analysis."}), 500
+
+@app.route('/api/analyze_form/batch/<job_id>', methods=['GET'])
+def analyze_form_batch_status(job_id):
+    """Progress of a batch import: task counts by outcome and 'running' / 'done'."""
+    job = batch_jobs.get(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "Batch job not found."}), 404
+    return jsonify({"status": "success", "job": job})
+
 @app.route('/api/get_learning_paths', methods=['GET'])
 def get_learning_paths():
     """Agent 2 - Part 1: Generates learning paths based on analysis."""
     try:
-        memory = read_memory()
-        analysis = memory.get('analysis')
+        session_id = get_session_id()
+        if not session_id:
+            return missing_session_response()
+
+        with span("state_read"):
+            state = session_store.get(session_id)
+        analysis = state.get('analysis')
 
         if not analysis:
             return jsonify({"status": "error", "message": "User analysis not found. Please submit the form first."}), 404
 
-        # Construct prompt for path generation
-        prompt = f"""
-        Based on the following user profile analysis, generate exactly 3 distinct learning path options suitable for a short session ({analysis.get('session_duration_category', 'approx 15-30 mins')}).
-
-        User Profile Analysis:
-        {json.dumps(analysis, indent=2)}
+        with span("cache_lookup"):
+            profile_block = get_profile_block(state)
+            cache_key = profile_key(PATHS_CACHE_NAMESPACE, analysis)
+            cached_paths = paths_cache.get(cache_key)
+        if cached_paths is not None:
+            prefetch_first_items(session_id, state, cached_paths)
+            return conditional_response(success_response(paths=cached_paths))
 
-        Focus on the user's goal: "{analysis.get('goal')}" and level: "{analysis.get('level')}".
-        Consider preferred styles: {', '.join(analysis.get('preferred_styles', []))}.
-        If a specific focus exists ({analysis.get('specific_focus')}), incorporate it into at least one path.
+        llm_gateway.admit() # Shed load before doing any model work
 
-        Output a JSON array where each element is an object with these keys:
-        - name: A short, descriptive name for the path (e.g., "Core Concepts Review", "Practical Example Task").
-        - duration: An estimated duration string (e.g., "Approx. 15 mins").
-        - overview: A brief (1-2 sentence) overview of what the path covers.
-        """
+        # Construct prompt for path generation
+        with span("prompt_build"):
+            prompt = route_prompt(learning_paths_prompt(profile_block), session_id, state)
 
-        simulated_response_str = call_gemini_api(prompt)
-        # --- EDIT: Added error check for API call failure ---
         try:
-            path_list = json.loads(simulated_response_str) # Parse the JSON string from AI
-            # Check if the AI returned an error structure itself (less likely for a list, but good practice)
-            if isinstance(path_list, dict) and path_list.get("status") == "error":
-                 print(f"AI API returned an error: {path_list.get('message')}")
-                 return jsonify({"status": "error", "message": path_list.get('message', 'AI processing error')}), 500
-            # Basic validation that we got a list
-            if not isinstance(path_list, list):
-                print(f"AI response for paths was not a list. Raw response: {simulated_response_str}")
-                raise json.JSONDecodeError("AI response was not a list", simulated_response_str, 0)
-
-        except json.JSONDecodeError:
-             # This might happen if the simulated response is malformed OR if the real AI response isn't valid JSON
-            print(f"Error decoding AI JSON response for paths. Raw response: {simulated_response_str}")
+            path_list = generate_parsed(prompt) # Validated list of paths
+        except (LLMUnavailable, LLMDeadlineExceeded) as e:
+            # Model unhealthy or too slow: serve expired cached paths, else generic ones (never cached)
+            log.warning("Serving fallback learning paths: %s", e.message)
+            path_list = paths_cache.get(cache_key, allow_stale=True) or degraded_learning_paths(analysis)
+            response = success_response(paths=path_list, degraded=True)
+            response.headers['Cache-Control'] = 'no-store' # Don't let a client revalidate against fallback paths
+            return response
+        except AIServiceError as e:
+            log.error("AI API returned an error: %s", e)
+            return jsonify({"status": "error", "message": str(e)}), 500
+        except ResponseParseError as e:
+            log.warning("Error decoding AI JSON response for paths: %s %s", e, e.errors)
             return jsonify({"status": "error", "message": "Failed to parse AI response (get_learning_paths)."}), 500
-        # --- End EDIT ---
 
-        # No need to store paths in memory for this simple MVP flow
+        # No need to store paths in the session; cache them for matching profiles
+        paths_cache.put(cache_key, path_list)
+        prefetch_first_items(session_id, state, path_list)
 
-        return jsonify({"status": "success", "paths": path_list})
+        return conditional_response(success_response(paths=path_list))
 
     except json.JSONDecodeError:
          # This might happen if the simulated response is malformed
-        print(f"Error decoding simulated JSON for paths.")
+        log.error("Error decoding simulated JSON for paths.")
         return jsonify({"status": "error", "message": "Error generating learning paths."}), 500
+    except LLMOverloaded as e:
+        return overloaded_response(e)
     except Exception as e:
-        print(f"Error in /api/get_learning_paths: {e}")
+        log.exception("Error in /api/get_learning_paths: %s", e)
         return jsonify({"status": "error", "message": "An internal server error occurred."}), 500
 
 @app.route('/api/start_quiz', methods=['POST'])
 def start_quiz():
     """Agent 2 - Part 2a: Starts the interaction based on chosen path."""
     try:
-        data = request.get_json()
+        with span("parse_request"):
+            data = request.get_json()
         chosen_path_name = data.get('chosen_path_name')
 
         if not chosen_path_name:
             return jsonify({"status": "error", "message": "No path name provided."}), 400
 
-        memory = read_memory()
-        analysis = memory.get('analysis')
+        session_id = get_session_id()
+        if not session_id:
+            return missing_session_response()
 
+        # Read first so an unknown session id never gets a row written
+        with span("state_read"):
+            analysis = session_store.get(session_id).get('analysis')
         if not analysis:
             return jsonify({"status": "error", "message": "User analysis not found. Please submit the form first."}), 404
 
-        memory['chosen_path'] = chosen_path_name
-        write_memory(memory)
-
-        # Construct prompt for the first interaction item
-        prompt = f"""
-        Your task is to help the user to upgrade their education process.
-        You are a friendly and encouraging AI Learning Mentor, best ever possible on the earth which
-        is combining all the learning methods and techniques to personalize education.
-        Have in mind that the user is always a student and you are a mentor.
-
-        The user has provided their profile analysis and chosen a learning path.
-        Generate the VERY FIRST learning item (material and a question) for an interactive session.
-
-        User Profile Analysis:
-        {json.dumps(analysis, indent=2)}
+        with span("state_write"), session_store.update(session_id) as state:
+            state['chosen_path'] = chosen_path_name
+            state.pop('history', None) # New path, new conversation
 
-        Chosen Learning Path: "{chosen_path_name}"
+        # Serve the speculatively prefetched item for this path if there is one
+        with span("cache_lookup"):
+            interaction_dict = prefetcher.take(session_id, chosen_path_name)
+        if interaction_dict is not None:
+            with span("state_write"):
+                begin_attempt(session_id, interaction_dict)
+            return success_response(interaction=interaction_dict)
 
-        Keep questions engaging, suitable for the user's level ({analysis.get('level')}).
-        The goal is to start the learning process based on the chosen path.
+        llm_gateway.admit() # Shed load before doing any model work
 
-        Output a JSON object with the following keys:
-        - material: A string containing the initial learning material (text, explanation, concept).
-        - question_for_user: A string containing a question for the user to answer based on the material.
-        - session_finished: A boolean, set to false for this initial step.
-        """
+        # Construct prompt for the first interaction item
+        with span("prompt_build"):
+            prompt = route_prompt(start_quiz_prompt(get_profile_block(state), chosen_path_name), session_id, state)
 
-        simulated_response_str = call_gemini_api(prompt)
-        # --- EDIT: Added error check for API call failure ---
         try:
-            interaction_dict = json.loads(simulated_response_str) # Parse the JSON string from AI
-            # Check if the AI returned an error structure itself
-            if isinstance(interaction_dict, dict) and interaction_dict.get("status") == "error":
-                 print(f"AI API returned an error: {interaction_dict.get('message')}")
-                 return jsonify({"status": "error", "message": interaction_dict.get('message', 'AI processing error')}), 500
-        except json.JSONDecodeError:
-            print(f"Error decoding AI JSON response for quiz start. Raw response: {simulated_response_str}")
+            interaction_dict = generate_parsed(prompt)
+        except AIServiceError as e:
+            log.error("AI API returned an error: %s", e)
+            return jsonify({"status": "error", "message": str(e)}), 500
+        except ResponseParseError as e:
+            log.warning("Error decoding AI JSON response for quiz start: %s %s", e, e.errors)
             return jsonify({"status": "error", "message": "Failed to parse AI response (start_quiz)."}), 500
-        # --- End EDIT ---
 
         # Store the current interaction state
-        memory = read_memory() # Re-read
-        memory['current_interaction'] = interaction_dict
-        write_memory(memory)
+        with span("state_write"):
+            begin_attempt(session_id, interaction_dict)
 
-        return jsonify({"status": "success", "interaction": interaction_dict})
+        return success_response(interaction=interaction_dict)
 
     except json.JSONDecodeError:
-        print(f"Error decoding simulated JSON for quiz start.")
+        log.error("Error decoding simulated JSON for quiz start.")
         return jsonify({"status": "error", "message": "Error starting interaction."}), 500
+    except LLMOverloaded as e:
+        return overloaded_response(e)
     except Exception as e:
-        print(f"Error in /api/start_quiz: {e}")
+        log.exception("Error in /api/start_quiz: %s", e)
         return jsonify({"status": "error", "message": "An internal server error occurred."}), 500
 
 @app.route('/api/submit_answer', methods=['POST'])
 def submit_answer():
     """Agent 2 - Part 2b: Processes user answer and provides feedback/next step OR summary."""
     try:
-        data = request.get_json()
+        with span("parse_request"):
+            data = request.get_json()
         user_answer = data.get('answer')
 
         if user_answer is None: # Allow empty string answers, but not missing key
             return jsonify({"status": "error", "message": "No answer provided."}), 400
 
-        memory = read_memory()
-        analysis = memory.get('analysis')
-        chosen_path = memory.get('chosen_path')
-        current_interaction = memory.get('current_interaction')
+        session_id = get_session_id()
+        if not session_id:
+            return missing_session_response()
+
+        llm_gateway.admit() # Shed load before doing any work
+        with span("state_read"):
+            state = session_store.get(session_id)
+        analysis = state.get('analysis')
+        chosen_path = state.get('chosen_path')
+        current_interaction = state.get('current_interaction')
 
         if not all([analysis, chosen_path, current_interaction]):
             # If context is missing, maybe allow starting over? For now, error.
             return jsonify({"status": "error", "message": "Session context not found. Please start over."}), 404
 
-        # --- Updated Prompt Construction ---
-        # Check if the user explicitly wants to continue after a summary screen
-        if user_answer == "SYSTEM_CONTINUE_SIGNAL":
-            # If user wants to continue, force generation of the next step
-            prompt = f"""
-            The user previously reached a session summary point for the path "{chosen_path}" but wants to continue learning on the SAME path.
-            Generate the NEXT logical learning item (material and question) based on their profile and the path.
-
-            User Profile Analysis:
-            {json.dumps(analysis, indent=2)}
-
-            Chosen Learning Path: "{chosen_path}"
-
-            Last Interaction (before summary):
-            Material Presented: {current_interaction.get('material', 'N/A')}
-            Question Asked: {current_interaction.get('question_for_user', 'N/A')}
-
-            Task: Generate the next step. Keep material concise and question engaging.
-
-            Output ONLY the required valid JSON object:
-            {{
-              "material": "...",
-              "question_for_user": "...",
-              "session_finished": false,
-              "summary": null
-            }}
-            """
-        else:
-            # Original logic: AI decides whether to continue or finish/summarize
-            prompt = f"""
-You are an AI Tutor assessing a user's answer during a learning session.
-
-User Profile Analysis:
-{json.dumps(analysis, indent=2)}
-
-Chosen Learning Path: "{chosen_path}"
-
-Previous Interaction Step:
-Material Presented: {current_interaction.get('material', 'N/A')}
-Question Asked: {current_interaction.get('question_for_user', 'N/A')}
-
-User's Latest Answer: "{user_answer}"
-
-Task:
-1. Analyze the user's answer based on the previous question, their profile (level: {analysis.get('level')}), and the overall goal ('{analysis.get('goal')}').
-2. Decide if the session should continue with the next logical step in the "{chosen_path}" path OR if the session should end (e.g., the path's objective for this short session is met, user seems stuck, user indicates wanting to stop).
-3. Generate a JSON response based on your decision:
-   - If CONTINUING: Set 'session_finished' to false. Provide the NEXT piece of 'material' and 'question_for_user'. Set 'summary' to null.
-   - If ENDING: Set 'session_finished' to true. Set 'material' and 'question_for_user' to null. Provide a 'summary' which MUST be a JSON object containing:
-     - recap: (string) Brief summary of what the user practiced/learned in this interaction block.
-     - strengths: (string) Positive feedback or areas where the user did well.
-     - areas_for_improvement: (string) Gentle suggestions on what to focus on next or areas that need more practice.
-     - next_step_suggestion: (string) A suggestion for what the user could learn or do next time related to their main goal.
-     - motivation: (string) A brief encouraging or motivational closing remark.
-
-Output ONLY the required valid JSON object adhering to this structure:
-{{
-  "material": "..." or null,
-  "question_for_user": "..." or null,
-  "session_finished": boolean,
-  "summary": {{ "recap": "...", "strengths": "...", "areas_for_improvement": "...", "next_step_suggestion": "...", "motivation": "..." }} or null
-}}
-"""
-        # --- End Updated Prompt Construction ---
+        with span("prompt_build"):
+            prompt = build_submit_answer_prompt(session_id, state, user_answer)
 
         ai_response_str = call_gemini_api(prompt)
 
         # --- Handling the AI Response ---
         try:
-            next_step_dict = json.loads(ai_response_str)
-            if isinstance(next_step_dict, dict) and next_step_dict.get("status") == "error":
-                 print(f"AI API returned an error: {next_step_dict.get('message')}")
-                 return jsonify({"status": "error", "message": next_step_dict.get('message', 'AI processing error')}), 500
-
-            # Validate base structure
-            if not all(k in next_step_dict for k in ["material", "question_for_user", "session_finished", "summary"]):
-                 raise ValueError("AI response missing base keys.")
-
-            # Validate summary structure IF session is finished
-            if next_step_dict.get('session_finished') and next_step_dict.get('summary'):
-                 summary_obj = next_step_dict['summary']
-                 if not isinstance(summary_obj, dict) or not all(k in summary_obj for k in ["recap", "strengths", "areas_for_improvement", "next_step_suggestion", "motivation"]):
-                     # If structure is wrong, maybe try to salvage the text or default? For MVP, error might be okay.
-                     print(f"Warning: AI finished session but summary structure is incorrect. Raw summary: {summary_obj}")
-                     # Fallback: Convert whatever summary we got into a simple string recap
-                     next_step_dict['summary'] = {
-                         "recap": str(summary_obj),
-                         "strengths": "N/A",
-                         "areas_for_improvement": "N/A",
-                         "next_step_suggestion": "N/A",
-                         "motivation": "Keep learning!"
-                     }
-                     # raise ValueError("AI response summary structure incorrect when session finished.")
-
+            next_step_dict = parse_ai_response(ai_response_str, prompt) # Validated against NEXT_STEP_SCHEMA
+        except AIServiceError as e:
+            log.error("AI API returned an error: %s", e)
+            return jsonify({"status": "error", "message": str(e)}), 500
         except (json.JSONDecodeError, ValueError) as e:
-            print(f"Error decoding/validating AI JSON response for answer submission. Error: {e}. Raw response: {ai_response_str}")
+            log.warning("Error decoding/validating AI JSON response for answer submission: %s", e)
+            log_model_text("Unparseable AI response", prompt.name, ai_response_str)
             return jsonify({"status": "error", "message": f"Failed to parse or validate AI response ({type(e).__name__})."}), 500
         # --- End Handling the AI Response ---
 
-        # Update memory
-        memory = read_memory()
-        # Store the *current* interaction state (which might be the summary screen info)
-        memory['current_interaction'] = next_step_dict
-        # Store chosen path and analysis if they aren't already there (should be, but safe)
-        if 'analysis' not in memory: memory['analysis'] = analysis
-        if 'chosen_path' not in memory: memory['chosen_path'] = chosen_path
-
-        # Clear specific 'final_summary' field if session is continuing
-        if not next_step_dict.get('session_finished'):
-             if 'final_summary' in memory:
-                 del memory['final_summary'] # Old field, potentially remove later
-        else:
-            # Store the structured summary separately if finished (optional, as it's in current_interaction)
-            memory['final_summary'] = next_step_dict.get('summary')
-
-
-        write_memory(memory)
+        # Update the session
+        with span("state_write"):
+            store_next_step(session_id, analysis, chosen_path, next_step_dict, current_interaction, user_answer)
 
         # Return the full interaction object to the frontend
         # The frontend will decide based on 'session_finished' whether to show interaction or results
-        return jsonify({"status": "success", "interaction": next_step_dict})
+        return success_response(interaction=next_step_dict)
 
     except json.JSONDecodeError:
         # This catches errors if the initial request.get_json() fails
         return jsonify({"status": "error", "message": "Invalid JSON data received in request."}), 400
+    except LLMOverloaded as e:
+        return overloaded_response(e)
     except Exception as e:
-        print(f"Error in /api/submit_answer: {e}")
-        import traceback
-        traceback.print_exc() # Print stack trace for debugging
+        log.exception("Error in /api/submit_answer: %s", e)
         return jsonify({"status": "error", "message": "An internal server error occurred."}), 500
 
+def stream_ready_interaction(interaction_dict):
+    """Sends an already-complete interaction (e.g. a prefetched one) with the same events as stream_interaction."""
+    lean = wants_lean(request)
+
+    def generate():
+        if interaction_dict.get('material'):
+            yield sse_event("material", {"delta": interaction_dict['material']})
+        fields = drop_nulls(interaction_dict) if lean else interaction_dict
+        for key, value in fields.items():
+            yield sse_event("field", {"name": key, "value": value})
+        yield done_event(interaction_dict, fields if lean else None)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/start_quiz/stream', methods=['POST'])
+def start_quiz_stream():
+    """Streaming variant of /api/start_quiz (server-sent events, see stream_interaction)."""
+    with span("parse_request"):
+        data = request.get_json(silent=True) or {}
+    chosen_path_name = data.get('chosen_path_name')
+
+    if not chosen_path_name:
+        return jsonify({"status": "error", "message": "No path name provided."}), 400
+
+    session_id = get_session_id()
+    if not session_id:
+        return missing_session_response()
+
+    # Read first so an unknown session id never gets a row written
+    with span("state_read"):
+        analysis = session_store.get(session_id).get('analysis')
+    if not analysis:
+        return jsonify({"status": "error", "message": "User analysis not found. Please submit the form first."}), 404
+
+    with span("state_write"), session_store.update(session_id) as state:
+        state['chosen_path'] = chosen_path_name
+        state.pop('history', None) # New path, new conversation
+
+    def finalize(interaction_dict):
+        begin_attempt(session_id, interaction_dict)
+
+    with span("cache_lookup"):
+        interaction_dict = prefetcher.take(session_id, chosen_path_name)
+    if interaction_dict is not None:
+        with span("state_write"):
+            finalize(interaction_dict)
+        return stream_ready_interaction(interaction_dict)
+
+    try:
+        llm_gateway.admit() # Shed load before doing any model work
+    except LLMOverloaded as e:
+        return overloaded_response(e)
+
+    with span("prompt_build"):
+        prompt = route_prompt(start_quiz_prompt(get_profile_block(state), chosen_path_name), session_id, state)
+    return stream_interaction(prompt, 'start_quiz', finalize)
+
+@app.route('/api/submit_answer/stream', methods=['POST'])
+def submit_answer_stream():
+    """Streaming variant of /api/submit_answer (server-sent events, see stream_interaction)."""
+    with span("parse_request"):
+        data = request.get_json(silent=True)
+    if data is None:
+        return jsonify({"status": "error", "message": "Invalid JSON data received in request."}), 400
+    user_answer = data.get('answer')
+
+    if user_answer is None: # Allow empty string answers, but not missing key
+        return jsonify({"status": "error", "message": "No answer provided."}), 400
+
+    session_id = get_session_id()
+    if not session_id:
+        return missing_session_response()
+
+    try:
+        llm_gateway.admit() # Shed load before doing any work
+    except LLMOverloaded as e:
+        return overloaded_response(e)
+
+    with span("state_read"):
+        state = session_store.get(session_id)
+    analysis = state.get('analysis')
+    chosen_path = state.get('chosen_path')
+    current_interaction = state.get('current_interaction')
+
+    if not all([analysis, chosen_path, current_interaction]):
+        return jsonify({"status": "error", "message": "Session context not found. Please start over."}), 404
+
+    def finalize(next_step_dict):
+        store_next_step(session_id, analysis, chosen_path, next_step_dict, current_interaction, user_answer)
+
+    with span("prompt_build"):
+        prompt = build_submit_answer_prompt(session_id, state, user_answer)
+    return stream_interaction(prompt, 'submit_answer', finalize)
+
+# --- Learner Progress (see progress_store.py) ---
+
+@app.route('/api/progress/sessions', methods=['GET'])
+def list_learner_sessions():
+    """
+    A learner's sessions (attempts), newest first: ?learner_id= (or the
+    current session's learner), optional ?status=active|finished, ?limit=
+    and the ?cursor= returned as next_cursor by the previous page.
+    """
+    learner_id = get_learner_id()
+    if not learner_id:
+        session_id = get_session_id()
+        if not session_id:
+            return jsonify({"status": "error", "message": "Missing learner id."}), 400
+        learner_id = session_store.get(session_id).get('learner_id')
+        if not learner_id:
+            return success_response(learner_id=None, sessions=[], next_cursor=None)
+    status = request.args.get('status')
+    if status and status not in ATTEMPT_STATUSES:
+        return jsonify({"status": "error", "message": f"Unknown status: {status}"}), 400
+    try:
+        with span("state_read"):
+            attempts, next_cursor = progress_store.learner_attempts(
+                learner_id, request.args.get('limit', type=int), request.args.get('cursor'), status)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return success_response(learner_id=learner_id, sessions=attempts, next_cursor=next_cursor)
+
+@app.route('/api/progress/learners', methods=['GET'])
+def list_path_learners():
+    """Learners who started the path given by ?path=, paginated like /api/progress/sessions."""
+    path = request.args.get('path')
+    if not path:
+        return jsonify({"status": "error", "message": "Missing path."}), 400
+    try:
+        with span("state_read"):
+            learners, next_cursor = progress_store.path_learners(
+                path, request.args.get('limit', type=int), request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return success_response(path=path, learners=learners, next_cursor=next_cursor)
+
+@app.route('/api/progress/sessions/<attempt_id>', methods=['GET'])
+def get_learner_session(attempt_id):
+    """One session with its final summary and every answered turn."""
+    with span("state_read"):
+        record = progress_store.get(attempt_id)
+    if record is None:
+        return jsonify({"status": "error", "message": "Session not found."}), 404
+    return success_response(session=record)
+
+@app.route('/api/progress/sessions/<attempt_id>/resume', methods=['POST'])
+def resume_learner_session(attempt_id):
+    """
+    Picks a stored session back up without a model call: rebuilds the
+    session state (profile, path, history, current interaction) from the
+    progress index into the caller's session or a new one, and returns the
+    interaction to show. The stored session is copied to a new one of the
+    caller's learner (returned as attempt_id), which later answers add to.
+    """
+    with span("state_read"):
+        record = progress_store.get(attempt_id)
+    if record is None:
+        return jsonify({"status": "error", "message": "Session not found."}), 404
+
+    with span("prompt_build"):
+        history = None
+        for turn in record['turn_log']:
+            history = record_turn(history, turn['material'], turn['question_for_user'], turn['answer'])
+
+    session_id = get_session_id() or new_session_id()
+    learner_id = learner_id_for(session_id, get_learner_id(), session_store.get(session_id).get('learner_id'))
+    copy_id = new_attempt_id()
+    with span("state_write"):
+        if not progress_store.copy(attempt_id, copy_id, learner_id):
+            return jsonify({"status": "error", "message": "Session not found."}), 404
+        with session_store.update(session_id) as state:
+            state.clear()
+            state.update({
+                "analysis": record['analysis'],
+                "profile_block": render_profile_block(record['analysis']),
+                "learner_id": learner_id,
+                "chosen_path": record['path'],
+                "current_interaction": record['current_interaction'],
+                "attempt_id": copy_id,
+            })
+            if history:
+                state['history'] = history
+            if record['status'] == 'finished':
+                state['final_summary'] = record['final_summary']
+    prefetcher.discard(session_id)
+
+    return success_response(session_id=session_id, learner_id=learner_id, attempt_id=copy_id,
+                            chosen_path=record['path'], interaction=record['current_interaction'],
+                            turns=record['turns'])
+
+@app.route('/api/llm/stats', methods=['GET'])
+def llm_stats():
+    """Call-level metrics for the model client, the call policy, the gateway queue and each model route."""
+    return jsonify({"status": "success", "client": gemini_client.stats(), "gateway": llm_gateway.stats(),
+                    "policy": call_policy.stats(), "routing": model_router.stats()})
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters for the learning-path response cache."""
+    return jsonify({"status": "success", "paths": paths_cache.stats(), "prefetch": prefetcher.stats(),
+                    "single_flight": single_flight.stats()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Request and per-phase latency histograms in the Prometheus text format."""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 # --- Initialization and Run ---
 
-if __name__ == '__main__':
-    # Ensure memory file exists
-    if not os.path.exists(MEMORY_FILE):
-        write_memory({}) # Create an empty JSON file if it doesn't exist
+# gunicorn serves create_app() (see gunicorn.conf.py). With preload_app the
+# master runs it once before forking, so every worker starts with the routes
+# registered and the LLM SDK already imported, sharing those pages
+# copy-on-write instead of each importing them on its first request.
+APP_WARM_LLM = os.environ.get("APP_WARM_LLM", "1") == "1"
+MAX_REQUEST_BYTES = int(os.environ.get("MAX_REQUEST_BYTES", 16 * 1024 * 1024))  # batch uploads included
+
+def create_app():
+    """Configures the app from the environment (FLASK_* overrides, debug off) and warms the LLM client."""
+    app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_BYTES
+    app.config.from_prefixed_env()
+    app.debug = False
+    if APP_WARM_LLM:
+        started = time.perf_counter()
+        gemini_client.warm()
+        log.info("LLM client warmed in %.2fs", time.perf_counter() - started)
+    return app
 
+if __name__ == '__main__':
+    # Development server only; FLASK_DEBUG=1 turns on the reloader and debugger
     port = int(os.environ.get("PORT", 8080))
-    app.run(host='0.0.0.0', port=port, debug=True) # Debug=True for development
+    create_app().run(host='0.0.0.0', port=port, debug=os.environ.get("FLASK_DEBUG") == "1")
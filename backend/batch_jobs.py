@@ -0,0 +1,66 @@
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from telemetry import get_logger
+
+# Background jobs for /api/analyze_form/batch. Job records live in their own
+# key space of the session backend (the batch_jobs table, see
+# build_session_store), so they are as durable as the sessions they created
+# but no session id can reach them. A record is updated as its tasks finish
+# and clients poll it with the job id. Tasks run on a small pool so a cohort
+# import never takes more than BATCH_MAX_WORKERS model calls away from
+# interactive traffic.
+
+BATCH_MAX_PROFILES = int(os.environ.get("BATCH_MAX_PROFILES", 2000))  # profiles per upload
+BATCH_MAX_WORKERS = int(os.environ.get("BATCH_MAX_WORKERS", 4))  # concurrent path generations
+
+log = get_logger("batch")
+
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+
+class BatchJobs:
+    """Creates job records and runs their tasks on a bounded thread pool."""
+
+    def __init__(self, store, max_workers=BATCH_MAX_WORKERS):
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix='batch')
+
+    def create(self, job_id, summary, tasks=None):
+        """
+        Stores a job record and starts tasks ({name: fn}). Each fn returns an
+        outcome label (e.g. "generated", "cached"), counted in the record's
+        'tasks' section; an exception counts as "failed".
+        """
+        tasks = tasks or {}
+        job = dict(summary, id=job_id, created_at=time.time(), finished_at=None,
+                   status="running" if tasks else "done",
+                   tasks={"total": len(tasks), "pending": len(tasks), "failed": 0})
+        if not tasks:
+            job["finished_at"] = job["created_at"]
+        self.store.put(job_id, job)
+        for name, fn in tasks.items():
+            self._executor.submit(self._run, job_id, name, fn)
+        return job
+
+    def get(self, job_id):
+        """The job record, or None if unknown."""
+        return self.store.get(job_id) or None
+
+    def _run(self, job_id, name, fn):
+        try:
+            outcome = fn()
+        except Exception as e:
+            log.warning("Batch job %s: task %s failed: %s", job_id, name, e)
+            outcome = "failed"
+        with self.store.update(job_id) as job:
+            counts = job["tasks"]
+            counts[outcome] = counts.get(outcome, 0) + 1
+            counts["pending"] -= 1
+            if counts["pending"] == 0:
+                job["status"] = "done"
+                job["finished_at"] = time.time()
@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+
+# Load-test harness for the API. Each virtual user runs the full learner flow
+# -- analyze_form, get_learning_paths, start_quiz, then submit_answer until
+# the session finishes or --turns is reached -- and the run reports latency
+# percentiles and throughput per endpoint, plus per-model-route latency,
+# parse failures and cost (see model_router.py).
+#
+# By default the app runs in-process (Flask test client) against the offline
+# mock model (LLM_BACKEND=mock, see mock_llm.py) with throwaway session and
+# progress databases, so results are repeatable and cost nothing. Pass --url
+# to drive a running server instead (start it with LLM_BACKEND=mock for the
+# same setup).
+#
+#   python benchmark.py --concurrency 32 --sessions 500
+#   MOCK_LLM_MALFORMED_RATE=0.1 python benchmark.py --profiles 20
+#   python benchmark.py --url http://localhost:8080 --json results.json
+
+ENDPOINTS = ("analyze_form", "get_learning_paths", "start_quiz", "submit_answer")
+
+FAMILIARITY = ("Beginner", "Intermediate", "Advanced")
+GOALS = ("guitar", "python", "spanish", "statistics", "drawing", "chess")
+
+
+def make_form(i):
+    """Profile i; --profiles bounds how many distinct ones there are (and so the paths cache hit rate)."""
+    return {
+        "goal": f"{GOALS[i % len(GOALS)]} {i}",
+        "familiarity": FAMILIARITY[i % len(FAMILIARITY)],
+        "styles": ["Visual", "Hands-on"][: 1 + i % 2],
+        "timeAvailable": "15 mins",
+        "specificFocus": "",
+        "achieveGoal": "Build a habit",
+        "sessionScope": "One small topic",
+    }
+
+
+# --- Transports ---
+
+class InProcessClient:
+    """Calls the app through Flask's test client (one per thread)."""
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, json=body, headers=headers or {})
+        return response.status_code, response.get_json(silent=True)
+
+
+class HTTPClient:
+    """Calls a running server over HTTP."""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def request(self, method, path, body=None, headers=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                     headers=dict(headers or {}, **{"Content-Type": "application/json"}))
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read() or b"null")
+        except urllib.error.HTTPError as e:
+            try:
+                return e.code, json.loads(e.read() or b"null")
+            except ValueError:
+                return e.code, None
+
+
+# --- Run ---
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.errors = {name: 0 for name in ENDPOINTS}
+        self.statuses = {}
+
+    def record(self, endpoint, seconds, status):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status >= 400:
+                self.errors[endpoint] += 1
+
+
+def timed(client, results, endpoint, method, path, body=None, headers=None):
+    started = time.perf_counter()
+    try:
+        status, data = client.request(method, path, body, headers)
+    except Exception as e:
+        print(f"{endpoint}: {e}", file=sys.stderr)
+        status, data = 599, None
+    results.record(endpoint, time.perf_counter() - started, status)
+    return status, data or {}
+
+
+def run_session(client, results, i, turns):
+    """One learner flow; stops at the first failed step."""
+    status, data = timed(client, results, "analyze_form", "POST", "/api/analyze_form", make_form(i))
+    if status != 200:
+        return
+    headers = {"X-Session-Id": data["session_id"]}
+
+    status, data = timed(client, results, "get_learning_paths", "GET", "/api/get_learning_paths", headers=headers)
+    if status != 200 or not data.get("paths"):
+        return
+
+    status, data = timed(client, results, "start_quiz", "POST", "/api/start_quiz",
+                         {"chosen_path_name": data["paths"][0]["name"]}, headers)
+    for turn in range(turns):
+        if status != 200 or data.get("interaction", {}).get("session_finished"):
+            return
+        status, data = timed(client, results, "submit_answer", "POST", "/api/submit_answer",
+                             {"answer": f"My answer for turn {turn + 1}"}, headers)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def report(results, wall_seconds):
+    rows = []
+    for name in ENDPOINTS:
+        values = sorted(results.latencies[name])
+        rows.append({
+            "endpoint": name,
+            "requests": len(values),
+            "errors": results.errors[name],
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": (values[-1] if values else 0.0) * 1000,
+            "throughput_rps": len(values) / wall_seconds if wall_seconds else 0.0,
+        })
+    return rows
+
+
+def print_report(rows, wall_seconds, statuses):
+    print(f"\n{'endpoint':<20}{'reqs':>7}{'errs':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'req/s':>9}")
+    for row in rows:
+        print(f"{row['endpoint']:<20}{row['requests']:>7}{row['errors']:>6}{row['p50_ms']:>10.1f}"
+              f"{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}{row['throughput_rps']:>9.1f}")
+    total = sum(row["requests"] for row in rows)
+    print(f"\n{total} requests in {wall_seconds:.2f}s ({total / wall_seconds:.1f} req/s); status codes: {statuses}")
+
+
+def phase_breakdown(totals):
+    """{endpoint: {phase: mean ms}} from the app's phase histogram (in-process runs)."""
+    phases = {}
+    for (endpoint, phase), (total, count) in sorted(totals.items()):
+        phases.setdefault(endpoint, {})[phase] = total / count * 1000 if count else 0.0
+    return phases
+
+
+def print_phases(phases):
+    print("\nmean ms per phase:")
+    for endpoint, by_phase in phases.items():
+        print(f"  {endpoint:<20}" + "  ".join(f"{phase}={ms:.1f}" for phase, ms in by_phase.items()))
+
+
+def print_routes(routes):
+    print("\nmodel routes:")
+    print(f"  {'route':<20}{'model':<26}{'calls':>6}{'p95 ms':>9}{'parse fail':>12}{'$/call':>11}")
+    for r in routes:
+        print(f"  {r['route']:<20}{r['model']:<26}{r['calls']:>6}{r['p95_seconds'] * 1000:>9.1f}"
+              f"{r['parse_failure_rate']:>12.1%}{r['cost_per_call_usd']:>11.6f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the learning API end to end.")
+    parser.add_argument("--url", help="Base URL of a running server (default: run the app in-process)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent virtual users")
+    parser.add_argument("--sessions", type=int, default=200, help="Learner flows to run in total")
+    parser.add_argument("--turns", type=int, default=3, help="Max submit_answer calls per flow")
+    parser.add_argument("--profiles", type=int, default=0, help="Distinct profiles (0 = one per flow)")
+    parser.add_argument("--timeout", type=float, default=60, help="HTTP timeout in seconds (--url only)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's INFO logging (in-process only)")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        make_client = lambda: HTTPClient(args.url, args.timeout)
+    else:
+        # Must be set before the app (and its modules) are imported
+        os.environ.setdefault("LLM_BACKEND", "mock")
+        scratch = tempfile.mkdtemp()
+        os.environ.setdefault("SESSION_DB_FILE", os.path.join(scratch, "sessions.db"))
+        os.environ.setdefault("PROGRESS_DB_FILE", os.path.join(scratch, "progress.db"))
+        if not args.verbose:
+            os.environ.setdefault("LOG_LEVEL", "WARNING")
+        import app as app_module
+        make_client = lambda: InProcessClient(app_module.app)
+
+    results = Results()
+    next_session = iter(range(args.sessions))
+    next_lock = threading.Lock()
+
+    def worker():
+        client = make_client()
+        while True:
+            with next_lock:
+                i = next(next_session, None)
+            if i is None:
+                return
+            run_session(client, results, i % args.profiles if args.profiles else i, args.turns)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall_seconds = time.perf_counter() - started
+
+    rows = report(results, wall_seconds)
+    print_report(rows, wall_seconds, results.statuses)
+    phases = None
+    if not args.url:
+        from telemetry import PHASE_SECONDS
+        phases = phase_breakdown(PHASE_SECONDS.totals())
+        print_phases(phases)
+    status, stats = make_client().request("GET", "/api/llm/stats")
+    routes = (stats or {}).get("routing", {}).get("routes") if status == 200 else None
+    if routes:
+        print_routes(routes)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "wall_seconds": wall_seconds, "statuses": results.statuses,
+                       "endpoints": rows, "phases": phases, "routes": routes}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+
+from llm_gateway import LLMOverloaded
+
+# Call policy between the gateway and the model client. Each call gets a
+# deadline by prompt template (i.e. by endpoint) covering every attempt;
+# transient failures (timeouts, connection errors, 408/429/5xx) are retried
+# with full-jitter exponential backoff while the deadline allows. Optional
+# hedging sends a second identical call once the first has run longer than
+# that template's recent p95 and keeps whichever answers first. A circuit
+# breaker counts consecutive transient failures and, once the provider looks
+# unhealthy, fails calls immediately with LLMUnavailable so endpoints can serve
+# cached or degraded content instead of waiting out the deadline.
+
+LLM_DEADLINE = float(os.environ.get("LLM_DEADLINE", 30))  # seconds per call, all attempts included
+LLM_DEADLINES = os.environ.get("LLM_DEADLINES", "learning_paths=20,start_quiz=20,continue=20,assess_answer=25,repair=10")
+LLM_RETRIES = int(os.environ.get("LLM_RETRIES", 2))
+LLM_RETRY_BACKOFF = float(os.environ.get("LLM_RETRY_BACKOFF", 0.3))  # seconds, doubled per attempt, full jitter
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_MIN_DELAY = float(os.environ.get("LLM_HEDGE_MIN_DELAY", 1.0))  # never hedge sooner than this
+LLM_HEDGE_BUDGET = float(os.environ.get("LLM_HEDGE_BUDGET", 0.1))  # max share of calls that may hedge
+LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", 5))  # consecutive failures to open
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", 30))  # seconds open before a probe
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+LATENCY_WINDOW = 200  # recent successful attempts per template and model, for the hedge delay
+MIN_HEDGE_SAMPLES = 20
+
+
+class LLMUnavailable(LLMOverloaded):
+    """The circuit breaker is open: the provider is failing, so calls fail fast."""
+
+    def __init__(self, retry_after):
+        super().__init__("The AI service is temporarily unavailable. Please retry shortly.", 503, retry_after)
+
+
+class LLMDeadlineExceeded(LLMOverloaded):
+    """The call did not finish within its deadline, retries included."""
+
+    def __init__(self):
+        super().__init__("The AI service took too long to respond. Please retry.", 504, 1)
+
+
+def parse_deadlines(spec):
+    """'name=seconds,...' -> {name: seconds}"""
+    deadlines = {}
+    for item in spec.split(","):
+        name, _, seconds = item.partition("=")
+        if name.strip() and seconds.strip():
+            deadlines[name.strip()] = float(seconds)
+    return deadlines
+
+
+def is_retryable(exc):
+    """Timeouts, connection errors and 408/429/5xx (google.api_core errors carry the status in .code)."""
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    code = getattr(exc, "code", None)
+    return isinstance(code, int) and code in RETRYABLE_STATUS
+
+
+class CircuitBreaker:
+    """closed -> open after `failures` consecutive failures -> one probe after `cooldown` -> closed or open."""
+
+    def __init__(self, failures=LLM_BREAKER_FAILURES, cooldown=LLM_BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go upstream now (in half-open state, only the one probe)."""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def retry_after(self):
+        with self._lock:
+            return max(1, int(self.cooldown - (time.monotonic() - self._opened_at) + 0.999))
+
+    def record(self, ok):
+        with self._lock:
+            self._probing = False
+            if ok:
+                self.state = "closed"
+                self._consecutive = 0
+                return
+            self._consecutive += 1
+            if self.state == "half_open" or self._consecutive >= self.failures:
+                if self.state != "open":
+                    self._opened += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def abandon(self):
+        """A call was cancelled before it told us anything; frees the probe slot."""
+        with self._lock:
+            self._probing = False
+
+    def stats(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self._consecutive, "times_opened": self._opened}
+
+
+class CallPolicy:
+    """
+    Wraps a client's generate/stream coroutines with deadlines, retries,
+    hedging and a circuit breaker. Used as the AsyncLLMGateway's callables,
+    so it runs on the gateway's event loop.
+    """
+
+    def __init__(self, generate, stream=None, deadlines=LLM_DEADLINES, default_deadline=LLM_DEADLINE,
+                 retries=LLM_RETRIES, backoff=LLM_RETRY_BACKOFF, hedge=LLM_HEDGE,
+                 hedge_min_delay=LLM_HEDGE_MIN_DELAY, hedge_budget=LLM_HEDGE_BUDGET, breaker=None):
+        self._generate = generate
+        self._stream = stream
+        self.deadlines = parse_deadlines(deadlines) if isinstance(deadlines, str) else dict(deadlines)
+        self.default_deadline = default_deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_budget = hedge_budget
+        self.breaker = breaker or CircuitBreaker()
+        self._latencies = {}  # template name -> deque of recent successful attempt seconds
+        self._lock = threading.Lock()
+        self._metrics = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0,
+                         "deadline_exceeded": 0, "short_circuited": 0, "failed": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._metrics[key] += 1
+
+    def deadline_for(self, prompt):
+        return self.deadlines.get(getattr(prompt, "name", None), self.default_deadline)
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            raise LLMUnavailable(self.breaker.retry_after())
+
+    async def _after_failure(self, exc, attempt, deadline, retry_allowed=True):
+        """Records a failed attempt; sleeps before the next one or raises."""
+        loop = asyncio.get_running_loop()
+        if isinstance(exc, asyncio.TimeoutError) and loop.time() >= deadline:
+            self.breaker.record(False)
+            self._count("deadline_exceeded")
+            raise LLMDeadlineExceeded() from exc
+        if not is_retryable(exc):
+            self.breaker.record(True)  # the provider answered; the request itself was bad
+            self._count("failed")
+            raise exc
+        self.breaker.record(False)
+        delay = random.uniform(0, self.backoff * 2 ** attempt)
+        if not retry_allowed or attempt >= self.retries or loop.time() + delay >= deadline:
+            self._count("failed")
+            raise exc
+        self._count("retries")
+        await asyncio.sleep(delay)
+        self._admit()  # the breaker may have opened meanwhile
+
+    # --- Hedging ---
+
+    def _latency_key(self, prompt):
+        name = getattr(prompt, "name", None)
+        model = getattr(prompt, "model", None)
+        return f"{name}@{model}" if model else name
+
+    def _observe(self, prompt, seconds):
+        name = self._latency_key(prompt)
+        with self._lock:
+            window = self._latencies.get(name)
+            if window is None:
+                window = self._latencies[name] = deque(maxlen=LATENCY_WINDOW)
+            window.append(seconds)
+
+    def _hedge_delay(self, prompt):
+        """The template's recent p95 latency on its model, or None if hedging is off, unwarmed or over budget."""
+        if not self.hedge:
+            return None
+        with self._lock:
+            window = self._latencies.get(self._latency_key(prompt))
+            if window is None or len(window) < MIN_HEDGE_SAMPLES:
+                return None
+            if self._metrics["hedges"] >= self.hedge_budget * self._metrics["calls"]:
+                return None
+            ordered = sorted(window)
+        return max(self.hedge_min_delay, ordered[int(len(ordered) * 0.95) - 1])
+
+    async def _timed(self, prompt):
+        started = time.perf_counter()
+        text = await self._generate(prompt)
+        self._observe(prompt, time.perf_counter() - started)
+        return text
+
+    async def _attempt(self, prompt):
+        delay = self._hedge_delay(prompt)
+        if delay is None:
+            return await self._timed(prompt)
+        tasks = [asyncio.ensure_future(self._timed(prompt))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return tasks[0].result()
+            self._count("hedges")
+            tasks.append(asyncio.ensure_future(self._timed(prompt)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is tasks[1]:
+                            self._count("hedge_wins")
+                        return task.result()
+            return tasks[0].result()  # both failed: raise the first call's error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    # --- Gateway callables ---
+
+    async def generate(self, prompt):
+        """Full reply text, within the template's deadline."""
+        self._admit()
+        self._count("calls")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_for(prompt)
+        attempt = 0
+        while True:
+            try:
+                text = await asyncio.wait_for(self._attempt(prompt), max(0.0, deadline - loop.time()))
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                raise
+            except Exception as e:
+                await self._after_failure(e, attempt, deadline)
+                attempt += 1
+                continue
+            self.breaker.record(True)
+            return text
+
+    async def stream(self, prompt):
+        """Text chunks within the template's deadline; only retried before the first chunk is sent."""
+        self._admit()
+        self._count("calls")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_for(prompt)
+        attempt = 0
+        while True:
+            chunks = self._stream(prompt).__aiter__()
+            sent = False
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), max(0.0, deadline - loop.time()))
+                    except StopAsyncIteration:
+                        break
+                    sent = True
+                    yield chunk
+            except (asyncio.CancelledError, GeneratorExit):
+                self.breaker.abandon()
+                raise
+            except Exception as e:
+                await self._after_failure(e, attempt, deadline, retry_allowed=not sent)
+                attempt += 1
+                continue
+            finally:
+                await chunks.aclose()
+            self.breaker.record(True)
+            return
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+            p95 = {name: sorted(w)[int(len(w) * 0.95) - 1] for name, w in self._latencies.items() if len(w) >= MIN_HEDGE_SAMPLES}
+        stats["breaker"] = self.breaker.stats()
+        stats["p95_seconds"] = p95
+        stats["hedging"] = self.hedge
+        return stats
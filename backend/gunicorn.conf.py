@@ -0,0 +1,35 @@
+import gc
+import os
+
+# Production server settings: gunicorn --config gunicorn.conf.py
+#
+# preload_app imports the app and runs create_app() once in the master, then
+# forks the workers: they share the loaded code and the warmed LLM SDK
+# copy-on-write, and a broken deploy fails once in the master instead of in
+# every worker. Threads, event loops and database connections are opened
+# lazily in each worker (see llm_gateway.py, session_store.py), never in the
+# master.
+
+wsgi_app = "app:create_app()"
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))  # SESSION_WRITE_BEHIND=1 only applies with 1 worker
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 64))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 0))  # model calls have their own deadlines (call_policy.py)
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))  # time to flush sessions on restart
+keepalive = 5
+preload_app = True
+loglevel = os.environ.get("LOG_LEVEL", "info").lower()
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before the first fork.
+    # Freezing moves everything allocated so far out of the collector's
+    # reach, so workers' GC passes don't write to (and copy) shared pages.
+    gc.freeze()
+
+    from llm_gateway import LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE
+    if LLM_MAX_CONCURRENCY + LLM_MAX_QUEUE >= threads:
+        server.log.warning("LLM_MAX_CONCURRENCY + LLM_MAX_QUEUE (%d) is not below the %d threads per worker; "
+                           "excess requests will wait in gunicorn instead of getting 429/503.",
+                           LLM_MAX_CONCURRENCY + LLM_MAX_QUEUE, threads)
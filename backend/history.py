@@ -0,0 +1,91 @@
+import os
+
+# Multi-turn history for submit_answer. Each session keeps the last few turns
+# verbatim plus a running summary of everything older; when a turn leaves the
+# window it is folded into the summary once, so a turn costs O(1) to record
+# and the prompt block stays within a fixed token budget however long the
+# session runs. Everything lives in the session state under 'history'.
+
+HISTORY_WINDOW = int(os.environ.get("HISTORY_WINDOW", 4))  # turns kept verbatim
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", 800))  # tokens for the prompt block
+HISTORY_SUMMARY_MAX_CHARS = int(os.environ.get("HISTORY_SUMMARY_MAX_CHARS", 1600))  # rendered summary block
+HISTORY_FIELD_MAX_CHARS = 600  # per material/question/answer in a stored turn
+
+CHARS_PER_TOKEN = 4  # rough estimate, good enough for budgeting
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _clip(text, limit):
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+def new_history():
+    return {"turns": [], "summary": [], "folded": 0}
+
+
+def record_turn(history, material, question, answer, window=HISTORY_WINDOW):
+    """Appends one turn (compact keys m/q/a) and folds turns that leave the window into the summary."""
+    history = history or new_history()
+    history["turns"].append({
+        "m": _clip(material, HISTORY_FIELD_MAX_CHARS),
+        "q": _clip(question, HISTORY_FIELD_MAX_CHARS),
+        "a": _clip(answer, HISTORY_FIELD_MAX_CHARS),
+    })
+    while len(history["turns"]) > window:
+        _fold(history, history["turns"].pop(0))
+    return history
+
+
+def turn_count(history):
+    """Turns answered so far, including those folded into the summary."""
+    return history["folded"] + len(history["turns"]) if history else 0
+
+
+def _summary_block(folded, lines):
+    """The rendered summary: header, an omitted-turns note and one bullet per line."""
+    dropped = folded - len(lines)
+    lines = ([f"({dropped} earlier turns omitted)"] if dropped > 0 else []) + lines
+    return "Summary of earlier turns:\n" + "\n".join(f"- {line}" for line in lines)
+
+
+def _fold(history, turn):
+    history["folded"] += 1
+    history["summary"].append(f"Q: {_clip(turn['q'], 140)} / A: {_clip(turn['a'], 140)}")
+    # Keep the rendered summary bounded: oldest lines go first
+    while (len(history["summary"]) > 1
+           and len(_summary_block(history["folded"], history["summary"])) > HISTORY_SUMMARY_MAX_CHARS):
+        history["summary"].pop(0)
+
+
+def render_history(history, token_budget=HISTORY_TOKEN_BUDGET):
+    """Prompt block with the summary and as many recent turns as fit in token_budget ('' if empty)."""
+    if not history or not (history.get("turns") or history.get("summary")):
+        return ""
+
+    parts = []
+    used = 0
+    lines = list(history["summary"])
+    while lines:
+        # Drop the oldest lines until the summary fits in half the budget
+        summary = _summary_block(history["folded"], lines)
+        if estimate_tokens(summary) <= token_budget // 2:
+            parts.append(summary)
+            used += estimate_tokens(summary)
+            break
+        lines.pop(0)
+
+    recent = []
+    for turn in reversed(history["turns"]):  # newest first, so the latest turns win the budget
+        block = f"Material: {turn['m']}\nQuestion: {turn['q']}\nUser answered: {turn['a']}"
+        cost = estimate_tokens(block)
+        if used + cost > token_budget:
+            break
+        recent.append(block)
+        used += cost
+    if recent:
+        parts.append("Recent turns (oldest first):\n" + "\n\n".join(reversed(recent)))
+    return "\n\n".join(parts)
@@ -0,0 +1,156 @@
+import os
+import time
+import threading
+
+from response_parsing import generation_config
+
+# genai.configure() tears down and rebuilds the SDK's transport clients, so it
+# must run once per worker rather than once per request. The client below
+# owns that setup, keeps one GenerativeModel per model name and system
+# instruction (all sharing the SDK's long-lived gRPC channel), and records
+# per-call timings and tokens.
+#
+# The SDK is most of the app's import time, so it is imported on first use
+# (or by warm(), which the gunicorn master calls before forking so workers
+# share the loaded modules copy-on-write). Neither configure() nor building
+# a GenerativeModel opens a channel; that happens on the first call, inside
+# the worker.
+#
+# Prompts are either plain strings or prompts.Prompt objects; for the latter
+# the template's static part goes in as system_instruction so it is an
+# identical prefix on every call of that template, and its schema (if any)
+# is sent as response_schema for structured JSON output.
+#
+# LLM_BACKEND picks the implementation: "gemini" (default) or "mock", the
+# offline stand-in in mock_llm.py used for benchmarks. Both expose the same
+# interface: api_key, generate_async, stream_async and stats.
+
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+
+_genai = None
+
+
+def load_genai():
+    """Imports google.generativeai on first use."""
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        _genai = genai
+    return _genai
+
+
+class GeminiClient:
+    """Long-lived Gemini client with call-level metrics."""
+
+    def __init__(self, api_key, model_name):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._models = {}
+        self._configured = False
+        self._lock = threading.Lock()
+        self._metrics = {
+            "setup_seconds": 0.0,
+            "calls": 0,
+            "errors": 0,
+            "network_seconds": 0.0,
+            "prompt_tokens": 0,
+            "output_tokens": 0,
+        }
+
+    def _configure(self):
+        # Caller holds self._lock
+        if not self._configured:
+            started = time.perf_counter()
+            load_genai().configure(api_key=self.api_key)
+            self._configured = True
+            self._metrics["setup_seconds"] = time.perf_counter() - started
+
+    def warm(self):
+        """Imports the SDK and, with an API key, configures it and builds the default model."""
+        load_genai()
+        if self.api_key:
+            self.model()
+
+    @classmethod
+    def from_env(cls):
+        """Builds a client from GEMINI_API_KEY and GEMINI_MODEL."""
+        return cls(os.environ.get("GEMINI_API_KEY"), os.environ.get("GEMINI_MODEL", "gemini-2.0-flash"))
+
+    def model(self, model_name=None, system_instruction=None):
+        """Returns the cached GenerativeModel for model_name (default: the configured model)."""
+        key = (model_name or self.model_name, system_instruction)
+        model = self._models.get(key)
+        if model is None:
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    self._configure()
+                    model = load_genai().GenerativeModel(key[0], system_instruction=system_instruction)
+                    self._models[key] = model
+        return model
+
+    def _model_and_contents(self, prompt, model_name):
+        system = getattr(prompt, "system", None)
+        contents = getattr(prompt, "user", prompt)
+        config = generation_config(getattr(prompt, "schema", None))
+        return self.model(model_name or getattr(prompt, "model", None), system), contents, config
+
+    def _record(self, started, prompt, usage=None, error=False):
+        if usage is not None and hasattr(prompt, "usage"):
+            prompt.usage = (getattr(usage, "prompt_token_count", 0) or 0,
+                            getattr(usage, "candidates_token_count", 0) or 0)
+        with self._lock:
+            self._metrics["calls"] += 1
+            self._metrics["network_seconds"] += time.perf_counter() - started
+            if error:
+                self._metrics["errors"] += 1
+            if usage is not None:
+                self._metrics["prompt_tokens"] += getattr(usage, "prompt_token_count", 0) or 0
+                self._metrics["output_tokens"] += getattr(usage, "candidates_token_count", 0) or 0
+
+    async def generate_async(self, prompt, model_name=None):
+        """Generates a full reply and returns its text."""
+        started = time.perf_counter()
+        try:
+            model, contents, config = self._model_and_contents(prompt, model_name)
+            response = await model.generate_content_async(contents, generation_config=config)
+            text = response.text
+        except Exception:
+            self._record(started, prompt, error=True)
+            raise
+        self._record(started, prompt, getattr(response, "usage_metadata", None))
+        return text
+
+    async def stream_async(self, prompt, model_name=None):
+        """Async generator over the text chunks of a streamed reply."""
+        started = time.perf_counter()
+        usage = None
+        try:
+            model, contents, config = self._model_and_contents(prompt, model_name)
+            response = await model.generate_content_async(contents, generation_config=config, stream=True)
+            async for chunk in response:
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                if chunk.text:
+                    yield chunk.text
+        except Exception:
+            self._record(started, prompt, usage, error=True)
+            raise
+        self._record(started, prompt, usage)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+        calls = stats["calls"] or 1
+        stats["model"] = self.model_name
+        stats["avg_network_seconds"] = stats["network_seconds"] / calls
+        return stats
+
+
+def build_llm_client():
+    """Returns the LLM client selected by LLM_BACKEND."""
+    if LLM_BACKEND == "mock":
+        from mock_llm import MockLLMClient
+        return MockLLMClient()
+    if LLM_BACKEND != "gemini":
+        raise ValueError(f"Unknown LLM_BACKEND: {LLM_BACKEND}")
+    return GeminiClient.from_env()
@@ -0,0 +1,180 @@
+import os
+import queue
+import asyncio
+import threading
+
+# All model calls from this worker go through one asyncio event loop running
+# in a background thread. Request threads only wait on a future, a semaphore
+# caps how many calls are in flight upstream, and once too many calls are
+# queued new requests are turned away with 429/503 instead of piling up.
+# The loop thread starts on the first call, in the process making it: a
+# gunicorn master that preloads the app never starts one, and each forked
+# worker gets its own.
+#
+# Each waiting call still holds a request thread, so the limits default to a
+# share of the worker's threads (GUNICORN_THREADS, as in gunicorn.conf.py):
+# with max_concurrency + max_queue below the thread count, admission rejects
+# while threads are left to send the 429 and serve the other endpoints.
+
+WORKER_THREADS = int(os.environ.get("GUNICORN_THREADS", 64))
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", max(1, WORKER_THREADS // 2)))  # in flight upstream
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", WORKER_THREADS // 4))  # calls allowed to wait for a slot
+LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", 20))  # seconds a call may wait for a slot
+
+
+class LLMOverloaded(Exception):
+    """Raised when a model call is rejected by backpressure."""
+
+    def __init__(self, message, status_code=429, retry_after=1):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AsyncLLMGateway:
+    """
+    Runs model coroutines on a shared event loop with bounded concurrency.
+
+    generate(prompt) must be a coroutine function returning the reply text;
+    stream(prompt), if given, an async generator yielding text chunks.
+    """
+
+    def __init__(self, generate, stream=None, max_concurrency=LLM_MAX_CONCURRENCY,
+                 max_queue=LLM_MAX_QUEUE, queue_timeout=LLM_QUEUE_TIMEOUT):
+        self._generate = generate
+        self._stream = stream
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._outstanding = 0  # queued + running
+        self._running = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._loop = None
+        self._loop_pid = None
+        self._semaphore = None
+
+    def _ensure_loop(self):
+        """The running event loop for this process, started on first use."""
+        if self._loop_pid == os.getpid():
+            return self._loop
+        with self._lock:
+            if self._loop_pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                ready = threading.Event()
+                threading.Thread(target=self._run_loop, args=(self._loop, ready), name='llm-gateway',
+                                 daemon=True).start()
+                ready.wait()
+                self._loop_pid = os.getpid()
+        return self._loop
+
+    def _run_loop(self, loop, ready):
+        asyncio.set_event_loop(loop)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    # --- Admission control ---
+
+    def _check_queue(self):
+        # Caller holds self._lock
+        if self._outstanding >= self.max_concurrency + self.max_queue:
+            self._rejected += 1
+            raise LLMOverloaded("Too many requests in progress. Please retry shortly.", 429)
+
+    def admit(self):
+        """Raises LLMOverloaded if the queue is already full; call before doing any request work."""
+        with self._lock:
+            self._check_queue()
+
+    def _enter(self):
+        with self._lock:
+            self._check_queue()
+            self._outstanding += 1
+
+    def _exit(self):
+        with self._lock:
+            self._outstanding -= 1
+
+    async def _acquire_slot(self):
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timed_out += 1
+            raise LLMOverloaded("The AI service is busy. Please retry shortly.", 503, retry_after=5)
+        with self._lock:
+            self._running += 1
+
+    def _release_slot(self):
+        with self._lock:
+            self._running -= 1
+        self._semaphore.release()
+
+    # --- Calls ---
+
+    async def _call(self, prompt):
+        await self._acquire_slot()
+        try:
+            return await self._generate(prompt)
+        finally:
+            self._release_slot()
+
+    def call(self, prompt):
+        """Runs one model call on the shared loop and blocks until its text is ready."""
+        self._enter()
+        try:
+            future = asyncio.run_coroutine_threadsafe(self._call(prompt), self._ensure_loop())
+            return future.result()
+        finally:
+            self._exit()
+
+    def stream(self, prompt):
+        """Yields text chunks of a streamed model call; holds one slot until the stream ends."""
+        if self._stream is None:
+            yield self.call(prompt)
+            return
+
+        self._enter()
+        chunks = queue.Queue()
+        done = object()
+
+        async def pump():
+            await self._acquire_slot()
+            try:
+                async for chunk in self._stream(prompt):
+                    chunks.put(chunk)
+            finally:
+                self._release_slot()
+
+        def finished(future):
+            chunks.put(done if future.cancelled() else (future.exception() or done))
+
+        future = None
+        try:
+            future = asyncio.run_coroutine_threadsafe(pump(), self._ensure_loop())
+            future.add_done_callback(finished)
+            while True:
+                item = chunks.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            if future is not None and not future.done():
+                future.cancel()  # client went away mid-stream
+            self._exit()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "outstanding": self._outstanding,
+                "running": self._running,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+            }
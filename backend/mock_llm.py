@@ -0,0 +1,173 @@
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import threading
+
+# Deterministic offline stand-in for GeminiClient (LLM_BACKEND=mock), used to
+# benchmark and capacity-plan the /api/* endpoints without network access or
+# spend. It implements the same interface as GeminiClient -- generate_async,
+# stream_async, stats -- and answers each prompt template with a reply of the
+# right shape. Latency, token rate, malformed-output and error rates are
+# configurable, and runs are reproducible for a given MOCK_LLM_SEED.
+
+MOCK_LLM_SEED = os.environ.get("MOCK_LLM_SEED", "0")
+# "fixed:MS", "uniform:LO_MS,HI_MS" or "lognormal:MEDIAN_MS,SIGMA"
+MOCK_LLM_FIRST_TOKEN = os.environ.get("MOCK_LLM_FIRST_TOKEN", "lognormal:400,0.5")
+MOCK_LLM_TOKENS_PER_SEC = float(os.environ.get("MOCK_LLM_TOKENS_PER_SEC", 80))
+MOCK_LLM_MALFORMED_RATE = float(os.environ.get("MOCK_LLM_MALFORMED_RATE", 0.0))
+MOCK_LLM_ERROR_RATE = float(os.environ.get("MOCK_LLM_ERROR_RATE", 0.0))
+MOCK_LLM_FINISH_RATE = float(os.environ.get("MOCK_LLM_FINISH_RATE", 0.3))  # assess turns that end the session
+MOCK_LLM_MATERIAL_WORDS = int(os.environ.get("MOCK_LLM_MATERIAL_WORDS", 120))
+
+_WORDS = ("practice scale chord rhythm concept example pattern review note timing "
+          "shape finger tempo exercise listen repeat focus detail step idea").split()
+
+
+def parse_distribution(spec):
+    """Turns a latency spec into a function rng -> seconds."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda rng: values[0] / 1000
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1]) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class MockLLMError(Exception):
+    """Simulated upstream failure (a 503, so the call policy treats it as transient)."""
+
+    code = 503
+
+
+class MockLLMClient:
+    """Offline replacement for GeminiClient with configurable latency and failure modes."""
+
+    def __init__(self, seed=MOCK_LLM_SEED, first_token=MOCK_LLM_FIRST_TOKEN,
+                 tokens_per_sec=MOCK_LLM_TOKENS_PER_SEC, malformed_rate=MOCK_LLM_MALFORMED_RATE,
+                 error_rate=MOCK_LLM_ERROR_RATE, finish_rate=MOCK_LLM_FINISH_RATE,
+                 material_words=MOCK_LLM_MATERIAL_WORDS):
+        self.api_key = "mock"
+        self.model_name = "mock"
+        self.seed = seed
+        self.first_token = parse_distribution(first_token)
+        self.tokens_per_sec = tokens_per_sec
+        self.malformed_rate = malformed_rate
+        self.error_rate = error_rate
+        self.finish_rate = finish_rate
+        self.material_words = material_words
+        self._lock = threading.Lock()
+        self._attempts = {}  # prompt digest -> times sent
+        self._metrics = {"setup_seconds": 0.0, "calls": 0, "errors": 0, "network_seconds": 0.0,
+                         "prompt_tokens": 0, "output_tokens": 0}
+
+    # --- Reply generation ---
+
+    def _rng(self, *parts):
+        digest = hashlib.sha256("|".join(str(p) for p in (self.seed,) + parts).encode("utf-8")).hexdigest()
+        return random.Random(int(digest[:16], 16))
+
+    def _text(self, rng, words):
+        return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+    def _reply(self, prompt, rng, malformed):
+        """A reply shaped by the prompt's schema (malformed on request)."""
+        name = getattr(prompt, "name", "")
+        schema = getattr(prompt, "schema", None) or {}
+        if schema.get("type") == "array":
+            value = [{"name": f"{self._text(rng, 3)[:-1]} Path {i + 1}", "duration": "Approx. 15 mins",
+                      "overview": self._text(rng, 20)} for i in range(3)]
+        elif name == "assess_answer" and rng.random() < self.finish_rate:
+            value = {"material": None, "question_for_user": None, "session_finished": True,
+                     "summary": {key: self._text(rng, 25) for key in
+                                 ("recap", "strengths", "areas_for_improvement", "next_step_suggestion", "motivation")}}
+        else:
+            value = {"material": self._text(rng, self.material_words),
+                     "question_for_user": self._text(rng, 12)[:-1] + "?",
+                     "session_finished": False}
+            if "summary" in schema.get("properties", {}):
+                value["summary"] = None
+        text = json.dumps(value)
+        if malformed:
+            text = self._malform(text, rng)
+        return text
+
+    def _malform(self, text, rng):
+        kind = rng.randrange(3)
+        if kind == 0:
+            return "```json\n" + text + "\n```"  # fenced
+        if kind == 1:
+            return "Here is the JSON:\n" + text.replace("}", ",}", 1)  # prose + trailing comma
+        return text[:max(1, int(len(text) * rng.uniform(0.3, 0.9)))]  # truncated
+
+    # --- GeminiClient interface ---
+
+    def _record(self, started, prompt, text, error=False):
+        usage = (len(str(prompt)) // 4, len(text) // 4)
+        if hasattr(prompt, "usage"):
+            prompt.usage = usage  # as the real client reports usage_metadata
+        with self._lock:
+            self._metrics["calls"] += 1
+            self._metrics["network_seconds"] += time.perf_counter() - started
+            self._metrics["prompt_tokens"] += usage[0]
+            self._metrics["output_tokens"] += usage[1]
+            if error:
+                self._metrics["errors"] += 1
+
+    def _plan(self, prompt, model_name):
+        """(reply text, fail, first-token delay) for this call.
+
+        The reply depends only on the prompt; latency and failures depend on
+        the prompt and how often it has been sent, so a retried call can succeed.
+        """
+        model_name = model_name or getattr(prompt, "model", None) or self.model_name
+        key = hashlib.sha256(f"{model_name}|{prompt}".encode("utf-8")).hexdigest()
+        with self._lock:
+            if len(self._attempts) > 100000:
+                self._attempts.clear()  # bound memory on long runs
+            attempt = self._attempts[key] = self._attempts.get(key, 0) + 1
+        call_rng = self._rng(key, attempt)
+        fail = call_rng.random() < self.error_rate
+        malformed = getattr(prompt, "name", "") != "repair" and call_rng.random() < self.malformed_rate
+        return self._reply(prompt, self._rng(key), malformed), fail, self.first_token(call_rng)
+
+    async def generate_async(self, prompt, model_name=None):
+        """Sleeps for the simulated first-token and generation time, then returns the reply."""
+        started = time.perf_counter()
+        text, fail, first_token = self._plan(prompt, model_name)
+        await asyncio.sleep(first_token + (len(text) / 4) / self.tokens_per_sec)
+        if fail:
+            self._record(started, prompt, "", error=True)
+            raise MockLLMError("Simulated upstream error")
+        self._record(started, prompt, text)
+        return text
+
+    async def stream_async(self, prompt, model_name=None):
+        """Yields the reply in ~16-token chunks paced at tokens_per_sec."""
+        started = time.perf_counter()
+        text, fail, first_token = self._plan(prompt, model_name)
+        await asyncio.sleep(first_token)
+        if fail:
+            self._record(started, prompt, "", error=True)
+            raise MockLLMError("Simulated upstream error")
+        chunk_chars = 64  # ~16 tokens per chunk
+        for i in range(0, len(text), chunk_chars):
+            await asyncio.sleep((chunk_chars / 4) / self.tokens_per_sec)
+            yield text[i:i + chunk_chars]
+        self._record(started, prompt, text)
+
+    def warm(self):
+        """Nothing to load; present so the app can warm any client."""
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+        stats["model"] = self.model_name
+        stats["avg_network_seconds"] = stats["network_seconds"] / (stats["calls"] or 1)
+        return stats
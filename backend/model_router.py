@@ -0,0 +1,238 @@
+import os
+import json
+import math
+import zlib
+import threading
+from collections import deque
+
+from history import estimate_tokens
+from telemetry import MODEL_CALL_SECONDS
+
+# Picks the model for each call. Rules are checked in order against the
+# prompt template (i.e. the endpoint), its estimated size, the learner's
+# familiarity level and whether this turn is likely to end with a summary;
+# the first match names a tier (fast / standard / large) or a model. The
+# choice is stored on the Prompt (prompt.model, prompt.route) so the client,
+# the call policy and single-flight all see it without extra arguments.
+#
+# Routing is opt-in (LLM_ROUTING=rules), and a tier that LLM_MODEL_TIERS
+# doesn't name falls back to the client's model (GEMINI_MODEL), so nothing
+# changes model until both are set, e.g.
+#   LLM_MODEL_TIERS=fast=gemini-2.0-flash-lite,large=gemini-2.5-flash
+#
+# Every route records its calls, latency, tokens and cost, and how often its
+# replies failed to parse, so tiers can be tuned for throughput per dollar.
+# Tokens are the counts the client reports (prompt.usage, from the API's
+# usage metadata); calls without them (e.g. coalesced ones) are estimated.
+#
+# LLM_ROUTING=ab splits sessions (stably, by session id) between rule set A
+# (LLM_ROUTE_RULES) and rule set B (LLM_ROUTE_RULES_B, default: everything on
+# the standard tier) to compare them on live traffic.
+#
+# Rules are a JSON list, e.g.
+#   [{"name": "beginners", "when": {"prompt": ["assess_answer"], "familiarity": ["Beginner"],
+#     "max_prompt_tokens": 1500}, "tier": "fast"}, {"name": "default", "when": {}, "tier": "standard"}]
+# Conditions: prompt, familiarity (lists); min_prompt_tokens, max_prompt_tokens;
+# summary_likely (bool). A rule gives a "tier" or a literal "model".
+
+LLM_ROUTING = os.environ.get("LLM_ROUTING", "off")  # off | rules | ab
+LLM_MODEL_TIERS = os.environ.get("LLM_MODEL_TIERS", "")  # tier=model,...; unnamed tiers use the client's model
+LLM_ROUTE_RULES = os.environ.get("LLM_ROUTE_RULES", "")  # JSON; empty = DEFAULT_RULES
+LLM_ROUTE_RULES_B = os.environ.get("LLM_ROUTE_RULES_B", "")  # JSON; empty = STANDARD_ONLY_RULES
+LLM_AB_SPLIT = float(os.environ.get("LLM_AB_SPLIT", 0.5))  # share of sessions in arm B
+LLM_AB_SALT = os.environ.get("LLM_AB_SALT", "1")  # change to reshuffle sessions between arms
+LLM_SUMMARY_LIKELY_TURNS = int(os.environ.get("LLM_SUMMARY_LIKELY_TURNS", 4))  # answered turns
+# USD per million input/output tokens
+LLM_MODEL_PRICES = os.environ.get(
+    "LLM_MODEL_PRICES", "gemini-2.0-flash-lite=0.075/0.30,gemini-2.0-flash=0.10/0.40,gemini-2.5-flash=0.30/2.50")
+
+DEFAULT_RULES = [
+    {"name": "repair", "when": {"prompt": ["repair"]}, "tier": "fast"},
+    {"name": "continue", "when": {"prompt": ["continue"]}, "tier": "fast"},
+    {"name": "summary", "when": {"prompt": ["assess_answer"], "summary_likely": True}, "tier": "large"},
+    {"name": "beginner_turn", "when": {"prompt": ["assess_answer"], "familiarity": ["Beginner"],
+                                       "max_prompt_tokens": 1500}, "tier": "fast"},
+    {"name": "default", "when": {}, "tier": "standard"},
+]
+STANDARD_ONLY_RULES = [{"name": "standard", "when": {}, "tier": "standard"}]
+
+LATENCY_WINDOW = 200  # recent calls per route, for the percentiles in stats()
+
+
+def parse_prices(spec):
+    """'model=in/out,...' -> {model: (usd per 1M input tokens, usd per 1M output tokens)}"""
+    prices = {}
+    for item in spec.split(","):
+        model, _, pair = item.partition("=")
+        if model.strip() and pair.strip():
+            price_in, _, price_out = pair.partition("/")
+            prices[model.strip()] = (float(price_in), float(price_out or 0))
+    return prices
+
+
+def parse_tiers(spec, standard):
+    """'tier=model,...' -> {tier: model}; 'standard' defaults to the client's model."""
+    tiers = {"standard": standard}
+    for item in spec.split(","):
+        tier, _, model = item.partition("=")
+        if tier.strip() and model.strip():
+            tiers[tier.strip()] = model.strip()
+    return tiers
+
+
+def load_rules(spec, default):
+    """Rules from a JSON spec (default when empty). Raises ValueError on a malformed spec."""
+    if not spec.strip():
+        return default
+    rules = json.loads(spec)
+    if not isinstance(rules, list) or not all(isinstance(r, dict) and ("tier" in r or "model" in r) for r in rules):
+        raise ValueError("Route rules must be a JSON list of objects with a 'tier' or 'model'.")
+    return rules
+
+
+class Route:
+    __slots__ = ("arm", "rule", "model")
+
+    def __init__(self, arm, rule, model):
+        self.arm = arm
+        self.rule = rule
+        self.model = model
+
+    @property
+    def name(self):
+        return f"{self.arm}/{self.rule}" if self.arm else self.rule
+
+
+def _percentile(ordered, p):
+    return ordered[max(0, math.ceil(len(ordered) * p) - 1)] if ordered else 0.0  # nearest rank
+
+
+class ModelRouter:
+    """Assigns a model to each prompt by rule and keeps per-route call statistics."""
+
+    def __init__(self, standard_model, mode=LLM_ROUTING, tiers=LLM_MODEL_TIERS, rules=LLM_ROUTE_RULES,
+                 rules_b=LLM_ROUTE_RULES_B, ab_split=LLM_AB_SPLIT, ab_salt=LLM_AB_SALT,
+                 summary_likely_turns=LLM_SUMMARY_LIKELY_TURNS, prices=LLM_MODEL_PRICES):
+        if mode not in ("off", "rules", "ab"):
+            raise ValueError(f"Unknown LLM_ROUTING: {mode}")
+        self.mode = mode
+        self.standard_model = standard_model
+        self.tiers = parse_tiers(tiers, standard_model)
+        self.rules = {"A": load_rules(rules, DEFAULT_RULES), "B": load_rules(rules_b, STANDARD_ONLY_RULES)}
+        self.ab_split = ab_split
+        self.ab_salt = ab_salt
+        self.summary_likely_turns = summary_likely_turns
+        self.prices = parse_prices(prices)
+        self._lock = threading.Lock()
+        self._routes = {}  # (route name, model) -> counters
+        self._latencies = {}  # (route name, model) -> deque of recent call seconds
+
+    # --- Routing ---
+
+    def arm_for(self, key):
+        """'A' or 'B' for a session id (or any stable key); always 'A' outside ab mode."""
+        if self.mode != "ab" or key is None:
+            return "A"
+        bucket = zlib.crc32(f"{self.ab_salt}:{key}".encode("utf-8")) / 2 ** 32
+        return "B" if bucket < self.ab_split else "A"
+
+    def _matches(self, when, name, tokens, familiarity, summary_likely):
+        if "prompt" in when and name not in when["prompt"]:
+            return False
+        if "familiarity" in when and familiarity not in when["familiarity"]:
+            return False
+        if "min_prompt_tokens" in when and tokens < when["min_prompt_tokens"]:
+            return False
+        if "max_prompt_tokens" in when and tokens > when["max_prompt_tokens"]:
+            return False
+        if "summary_likely" in when and bool(when["summary_likely"]) != summary_likely:
+            return False
+        return True
+
+    def route(self, prompt, key=None, familiarity=None, turns=0, arm=None):
+        """
+        Picks prompt's model and stores it on the prompt (prompt.model,
+        prompt.route); key (the session id) fixes the A/B arm unless arm is
+        given. Returns the prompt.
+        """
+        if self.mode == "off":
+            prompt.route = Route(None, "default", self.standard_model)
+            return prompt
+        arm = arm or self.arm_for(key)
+        name = getattr(prompt, "name", None)
+        tokens = estimate_tokens(str(prompt))
+        summary_likely = turns + 1 >= self.summary_likely_turns
+        for rule in self.rules[arm]:
+            if self._matches(rule.get("when") or {}, name, tokens, familiarity, summary_likely):
+                model = rule.get("model") or self.tiers.get(rule.get("tier"), self.standard_model)
+                prompt.route = Route(arm if self.mode == "ab" else None, rule.get("name") or rule.get("tier"), model)
+                break
+        else:
+            prompt.route = Route(arm if self.mode == "ab" else None, "default", self.standard_model)
+        prompt.model = prompt.route.model
+        return prompt
+
+    # --- Statistics ---
+
+    def _counters(self, prompt):
+        # Caller holds self._lock
+        route = getattr(prompt, "route", None)
+        key = (route.name, route.model) if route else ("unrouted", self.standard_model)
+        counters = self._routes.get(key)
+        if counters is None:
+            counters = self._routes[key] = {"calls": 0, "errors": 0, "seconds": 0.0, "prompt_tokens": 0,
+                                            "output_tokens": 0, "estimated_calls": 0, "parsed": 0,
+                                            "parse_failures": 0, "repair_failures": 0}
+            self._latencies[key] = deque(maxlen=LATENCY_WINDOW)
+        return key, counters
+
+    def record_call(self, prompt, seconds, reply=None, error=False):
+        """One finished model call (reply is the text, None on error)."""
+        usage = getattr(prompt, "usage", None)
+        if usage is not None:
+            prompt.usage = None  # consumed; a later call on this prompt reports its own
+        with self._lock:
+            key, counters = self._counters(prompt)
+            MODEL_CALL_SECONDS.observe(key, seconds)
+            counters["calls"] += 1
+            counters["seconds"] += seconds
+            self._latencies[key].append(seconds)
+            if usage is not None:
+                counters["prompt_tokens"] += usage[0]
+                counters["output_tokens"] += usage[1]
+            else:
+                counters["estimated_calls"] += 1
+                counters["prompt_tokens"] += estimate_tokens(str(prompt))
+                counters["output_tokens"] += 0 if error else estimate_tokens(reply or "")
+            if error:
+                counters["errors"] += 1
+
+    def record_parse(self, prompt, outcome):
+        """outcome: 'ok', 'repaired' (first parse failed, repair worked) or 'failed'."""
+        with self._lock:
+            _, counters = self._counters(prompt)
+            counters["parsed"] += 1
+            if outcome != "ok":
+                counters["parse_failures"] += 1
+            if outcome == "failed":
+                counters["repair_failures"] += 1
+
+    def cost(self, model, prompt_tokens, output_tokens):
+        price_in, price_out = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * price_in + output_tokens * price_out) / 1e6
+
+    def stats(self):
+        with self._lock:
+            snapshot = {key: (dict(c), sorted(self._latencies[key])) for key, c in self._routes.items()}
+        routes = []
+        for (name, model), (c, ordered) in sorted(snapshot.items()):
+            cost = self.cost(model, c["prompt_tokens"], c["output_tokens"])
+            routes.append(dict(
+                c, route=name, model=model,
+                avg_seconds=c["seconds"] / (c["calls"] or 1),
+                p50_seconds=_percentile(ordered, 0.5), p95_seconds=_percentile(ordered, 0.95),
+                parse_failure_rate=c["parse_failures"] / (c["parsed"] or 1),
+                cost_usd=cost, cost_per_call_usd=cost / (c["calls"] or 1),
+            ))
+        return {"mode": self.mode, "tiers": self.tiers, "ab_split": self.ab_split if self.mode == "ab" else None,
+                "routes": routes}
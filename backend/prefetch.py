@@ -0,0 +1,121 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from telemetry import get_logger
+
+# Speculative prefetch: as soon as the three learning paths are generated we
+# start the first start_quiz item for each of them in the background, so the
+# path the learner picks is usually ready (or already on its way) when
+# /api/start_quiz is called. Off by default; PREFETCH_MAX_INFLIGHT is the
+# per-worker budget of speculative model calls.
+
+PREFETCH_ENABLED = os.environ.get("PREFETCH_FIRST_ITEM", "0") == "1"
+PREFETCH_MAX_INFLIGHT = int(os.environ.get("PREFETCH_MAX_INFLIGHT", 12))
+PREFETCH_TTL = float(os.environ.get("PREFETCH_TTL", 15 * 60))  # seconds an unused entry is kept
+
+log = get_logger("prefetch")
+
+
+class Prefetcher:
+    """
+    Runs fetch(prompt) for speculative items in a thread pool and keeps the
+    futures per session. fetch must return the parsed item, or None when the
+    result should not be served.
+    """
+
+    def __init__(self, fetch, enabled=PREFETCH_ENABLED, max_inflight=PREFETCH_MAX_INFLIGHT, ttl=PREFETCH_TTL):
+        self.fetch = fetch
+        self.enabled = enabled and max_inflight > 0
+        self.ttl = ttl
+        self._budget = threading.BoundedSemaphore(max(max_inflight, 1))
+        self._executor = ThreadPoolExecutor(max_workers=max(max_inflight, 1), thread_name_prefix='prefetch')
+        self._lock = threading.Lock()
+        self._sessions = {}  # session_id -> (created_at, {key: future})
+        self._counts = {"scheduled": 0, "skipped_budget": 0, "hits": 0, "misses": 0, "discarded": 0, "kept": 0}
+
+    def schedule(self, session_id, prompts):
+        """
+        Starts fetching {key: prompt} for a session. While the session is
+        offered the same keys (e.g. a repeated paths request), entries already
+        prefetched are kept and only missing keys are started; otherwise
+        everything prefetched before is replaced.
+        """
+        if not self.enabled:
+            return
+        self._expire()
+        with self._lock:
+            created_at, current = self._sessions.get(session_id, (None, {}))
+            keep = bool(current) and set(current) <= set(prompts)
+            if keep:
+                self._counts["kept"] += len(current)
+        if not keep:
+            self.discard(session_id)
+            created_at, current = time.time(), {}
+        futures = {}
+        for key, prompt in prompts.items():
+            if key in current:
+                continue
+            if not self._budget.acquire(blocking=False):
+                with self._lock:
+                    self._counts["skipped_budget"] += 1
+                continue
+            future = self._executor.submit(self.fetch, prompt)
+            # Done callbacks also fire on cancel, so the budget is always returned
+            future.add_done_callback(lambda _: self._budget.release())
+            futures[key] = future
+        with self._lock:
+            self._counts["scheduled"] += len(futures)
+            if futures or current:
+                self._sessions[session_id] = (created_at, dict(current, **futures))
+
+    def take(self, session_id, key):
+        """
+        Returns the prefetched item for key (waiting if it is still in flight,
+        which is never slower than starting over), or None. The session's other
+        entries are cancelled.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            _, futures = self._sessions.pop(session_id, (None, {}))
+        future = futures.pop(key, None)
+        self._cancel(futures)
+        item = None
+        if future is not None and not future.cancelled():
+            try:
+                item = future.result()
+            except Exception as e:
+                log.warning("Prefetch for '%s' failed: %s", key, e)
+        with self._lock:
+            self._counts["hits" if item is not None else "misses"] += 1
+        return item
+
+    def discard(self, session_id):
+        """Drops (and cancels where possible) everything prefetched for a session."""
+        with self._lock:
+            _, futures = self._sessions.pop(session_id, (None, {}))
+        self._cancel(futures)
+
+    def _cancel(self, futures):
+        if not futures:
+            return
+        for future in futures.values():
+            future.cancel()  # queued calls never start; running ones finish and are dropped
+        with self._lock:
+            self._counts["discarded"] += len(futures)
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            stale = [sid for sid, (created_at, _) in self._sessions.items() if created_at < cutoff]
+        for session_id in stale:
+            self.discard(session_id)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats["sessions"] = len(self._sessions)
+        stats["enabled"] = self.enabled
+        return stats
@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import uuid
+import base64
+import sqlite3
+import threading
+
+# Durable index of learning sessions, kept apart from the per-session state
+# (which only holds the latest path and a bounded history). Every path a
+# learner starts is an "attempt": one row keyed by learner, path and start
+# time, holding the current interaction and, once finished, the final
+# summary, plus one row per answered turn. Learners come back to an attempt
+# days later through the resume endpoint, which copies it into a new attempt
+# of their own and rebuilds the session from those rows without calling the
+# model, so resuming never writes to someone else's record.
+#
+# Learner ids are issued separately from session ids: listings return
+# learner ids, and a session id must never be readable from them.
+#
+# Listings are keyset-paginated: the cursor is the sort key of the last row
+# returned, so a page costs an index range scan however deep it is.
+
+PROGRESS_DB_FILE = os.environ.get("PROGRESS_DB_FILE", "progress.db")
+PROGRESS_PAGE_SIZE = int(os.environ.get("PROGRESS_PAGE_SIZE", 20))
+PROGRESS_MAX_PAGE_SIZE = int(os.environ.get("PROGRESS_MAX_PAGE_SIZE", 100))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    id TEXT PRIMARY KEY,
+    learner_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    goal TEXT,
+    analysis TEXT NOT NULL,
+    status TEXT NOT NULL,
+    turns INTEGER NOT NULL DEFAULT 0,
+    current_interaction TEXT,
+    final_summary TEXT,
+    started_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS attempts_by_learner ON attempts (learner_id, started_at, id);
+CREATE INDEX IF NOT EXISTS attempts_by_path ON attempts (path, learner_id, started_at);
+CREATE TABLE IF NOT EXISTS turns (
+    attempt_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    material TEXT,
+    question TEXT,
+    answer TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (attempt_id, seq)
+) WITHOUT ROWID;
+"""
+
+ATTEMPT_STATUSES = ("active", "finished")
+
+_SUMMARY_COLUMNS = "id, learner_id, path, goal, status, turns, final_summary, started_at, updated_at, finished_at"
+
+
+def new_attempt_id():
+    return uuid.uuid4().hex
+
+
+def new_learner_id():
+    return uuid.uuid4().hex
+
+
+def encode_cursor(*key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, size):
+    """The sort key packed in a cursor; raises ValueError if it isn't one of ours."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor.")
+    if (not isinstance(key, list) or len(key) != size
+            or not all(isinstance(k, (int, float, str)) and not isinstance(k, bool) for k in key)):
+        raise ValueError("Invalid cursor.")
+    return key
+
+
+def page_size(limit):
+    """Clamps a requested page size to 1..PROGRESS_MAX_PAGE_SIZE (default PROGRESS_PAGE_SIZE)."""
+    return max(1, min(int(limit or PROGRESS_PAGE_SIZE), PROGRESS_MAX_PAGE_SIZE))
+
+
+class ProgressStore:
+    """Attempts and their turns in a WAL-mode SQLite file."""
+
+    def __init__(self, path=PROGRESS_DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():  # never reuse one inherited across fork
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # --- Writes ---
+
+    def start(self, attempt_id, learner_id, path, analysis, interaction):
+        """Opens an attempt with its first interaction."""
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO attempts (id, learner_id, path, goal, analysis, status, current_interaction,"
+            " started_at, updated_at) VALUES (?, ?, ?, ?, ?, 'active', ?, ?, ?)",
+            (attempt_id, learner_id, path, (analysis or {}).get("learning_goal"), json.dumps(analysis),
+             json.dumps(interaction), now, now))
+
+    def copy(self, attempt_id, new_id, learner_id):
+        """Copies an attempt and its turns to a new attempt of learner_id; False if attempt_id is unknown."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            copied = conn.execute(
+                "INSERT INTO attempts (id, learner_id, path, goal, analysis, status, turns, current_interaction,"
+                " final_summary, started_at, updated_at, finished_at)"
+                " SELECT ?, ?, path, goal, analysis, status, turns, current_interaction, final_summary, ?, ?,"
+                " finished_at FROM attempts WHERE id = ?",
+                (new_id, learner_id, now, now, attempt_id)).rowcount
+            if copied:
+                conn.execute("INSERT INTO turns (attempt_id, seq, material, question, answer, created_at)"
+                             " SELECT ?, seq, material, question, answer, created_at FROM turns WHERE attempt_id = ?",
+                             (new_id, attempt_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return bool(copied)
+
+    def record_turn(self, attempt_id, asked, answer, interaction):
+        """
+        Appends the answered turn (skipped when answer is None, e.g. a continue
+        signal) and moves the attempt on to the next interaction, storing the
+        summary if it finished the attempt.
+        """
+        now = time.time()
+        finished = bool(interaction.get("session_finished"))
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT turns FROM attempts WHERE id = ?", (attempt_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return
+            turns = row[0]
+            if answer is not None:
+                conn.execute("INSERT INTO turns (attempt_id, seq, material, question, answer, created_at)"
+                             " VALUES (?, ?, ?, ?, ?, ?)",
+                             (attempt_id, turns, asked.get("material"), asked.get("question_for_user"), answer, now))
+                turns += 1
+            if finished:
+                conn.execute("UPDATE attempts SET status = 'finished', turns = ?, current_interaction = ?,"
+                             " final_summary = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+                             (turns, json.dumps(interaction), json.dumps(interaction.get("summary")), now, now,
+                              attempt_id))
+            else:
+                conn.execute("UPDATE attempts SET status = 'active', turns = ?, current_interaction = ?,"
+                             " updated_at = ? WHERE id = ?",
+                             (turns, json.dumps(interaction), now, attempt_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # --- Reads ---
+
+    def _summary(self, row):
+        keys = ("id", "learner_id", "path", "goal", "status", "turns", "final_summary",
+                "started_at", "updated_at", "finished_at")
+        record = dict(zip(keys, row))
+        record["final_summary"] = json.loads(record["final_summary"]) if record["final_summary"] else None
+        return record
+
+    def get(self, attempt_id):
+        """The attempt with its analysis, current interaction and turns, or None."""
+        conn = self._conn()
+        row = conn.execute(f"SELECT {_SUMMARY_COLUMNS}, analysis, current_interaction FROM attempts WHERE id = ?",
+                           (attempt_id,)).fetchone()
+        if row is None:
+            return None
+        record = self._summary(row[:-2])
+        record["analysis"] = json.loads(row[-2])
+        record["current_interaction"] = json.loads(row[-1]) if row[-1] else None
+        record["turn_log"] = [
+            {"material": material, "question_for_user": question, "answer": answer, "at": created_at}
+            for material, question, answer, created_at in conn.execute(
+                "SELECT material, question, answer, created_at FROM turns WHERE attempt_id = ? ORDER BY seq",
+                (attempt_id,))
+        ]
+        return record
+
+    def learner_attempts(self, learner_id, limit=None, cursor=None, status=None):
+        """
+        A learner's attempts, newest first, without turns. Returns
+        (attempts, next_cursor); next_cursor is None on the last page.
+        """
+        limit = page_size(limit)
+        sql = f"SELECT {_SUMMARY_COLUMNS} FROM attempts WHERE learner_id = ?"
+        params = [learner_id]
+        if cursor:
+            sql += " AND (started_at, id) < (?, ?)"
+            params.extend(decode_cursor(cursor, 2))
+        if status:
+            sql += " AND status = ?"
+            params.append(status)
+        sql += " ORDER BY started_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+        rows = self._conn().execute(sql, params).fetchall()
+        attempts = [self._summary(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = attempts[-1]
+            next_cursor = encode_cursor(last["started_at"], last["id"])
+        return attempts, next_cursor
+
+    def path_learners(self, path, limit=None, cursor=None):
+        """
+        Learners who started path, by learner id, with their attempt counts.
+        Returns (learners, next_cursor).
+        """
+        limit = page_size(limit)
+        sql = ("SELECT learner_id, COUNT(*), SUM(status = 'finished'), MAX(started_at)"
+               " FROM attempts WHERE path = ?")
+        params = [path]
+        if cursor:
+            sql += " AND learner_id > ?"
+            params.extend(decode_cursor(cursor, 1))
+        sql += " GROUP BY learner_id ORDER BY learner_id LIMIT ?"
+        params.append(limit + 1)
+        rows = self._conn().execute(sql, params).fetchall()
+        learners = [{"learner_id": learner_id, "attempts": attempts, "finished": finished,
+                     "last_started_at": last_started_at}
+                    for learner_id, attempts, finished, last_started_at in rows[:limit]]
+        next_cursor = encode_cursor(learners[-1]["learner_id"]) if len(rows) > limit else None
+        return learners, next_cursor
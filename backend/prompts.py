@@ -0,0 +1,161 @@
+import json
+
+from response_parsing import LEARNING_PATHS_SCHEMA, FIRST_ITEM_SCHEMA, NEXT_STEP_SCHEMA
+
+# Prompt templates for the model calls. Every template is split into a static
+# system part (persona, task, output format), built once at import, and a
+# small per-request user part. The system part is sent as the model's
+# system_instruction, so it is a byte-identical prefix on every call of that
+# template -- the shape the provider's context caching needs -- and requests
+# only pay to format the user part. Bump PROMPT_VERSION whenever a template
+# changes; caches keyed on prompts include it. Each template also carries the
+# JSON schema its reply must match (see response_parsing.py).
+
+PROMPT_VERSION = "v2"
+
+
+class Prompt:
+    """
+    A rendered prompt: the template's static system part, the per-request
+    user part and the reply schema. model and route are set by the model
+    router (None: the client's default model); usage is set by the client
+    after a call, as (prompt tokens, output tokens).
+    """
+
+    __slots__ = ("name", "system", "user", "schema", "model", "route", "usage")
+
+    def __init__(self, name, system, user, schema=None):
+        self.name = name
+        self.system = system
+        self.user = user
+        self.schema = schema
+        self.model = None
+        self.route = None
+        self.usage = None
+
+    def __str__(self):
+        return f"{self.system}\n\n{self.user}"
+
+    def __contains__(self, text):
+        return text in self.system or text in self.user
+
+
+def render_profile_block(analysis):
+    """Serializes the profile once per session (see analyze_form); compact 'key: value' lines."""
+    lines = []
+    for key, value in analysis.items():
+        if isinstance(value, list):
+            value = ", ".join(str(v) for v in value) or "None"
+        elif not isinstance(value, str):
+            value = json.dumps(value)
+        lines.append(f"- {key}: {value}")
+    return "\n".join(lines)
+
+
+# --- Static parts (rendered once) ---
+
+MENTOR_PERSONA = """Your task is to help the user to upgrade their education process.
+You are a friendly and encouraging AI Learning Mentor, best ever possible on the earth which
+is combining all the learning methods and techniques to personalize education.
+Have in mind that the user is always a student and you are a mentor."""
+
+SUMMARY_FIELDS = """     - recap: (string) Brief summary of what the user practiced/learned in this interaction block.
+     - strengths: (string) Positive feedback or areas where the user did well.
+     - areas_for_improvement: (string) Gentle suggestions on what to focus on next or areas that need more practice.
+     - next_step_suggestion: (string) A suggestion for what the user could learn or do next time related to their main goal.
+     - motivation: (string) A brief encouraging or motivational closing remark."""
+
+LEARNING_PATHS_SYSTEM = """Based on the user profile analysis you are given, generate exactly 3 distinct learning path options suitable for a short session (see time_available_per_session and desired_session_scope).
+
+Focus on the user's learning_goal and familiarity_level.
+Consider their preferred_styles.
+If specific_focus_notes are given, incorporate them into at least one path.
+
+Output a JSON array where each element is an object with these keys:
+- name: A short, descriptive name for the path (e.g., "Core Concepts Review", "Practical Example Task").
+- duration: An estimated duration string (e.g., "Approx. 15 mins").
+- overview: A brief (1-2 sentence) overview of what the path covers."""
+
+START_QUIZ_SYSTEM = MENTOR_PERSONA + """
+
+The user has provided their profile analysis and chosen a learning path.
+Generate the VERY FIRST learning item (material and a question) for an interactive session.
+
+Keep questions engaging, suitable for the user's familiarity_level.
+The goal is to start the learning process based on the chosen path.
+
+Output a JSON object with the following keys:
+- material: A string containing the initial learning material (text, explanation, concept).
+- question_for_user: A string containing a question for the user to answer based on the material.
+- session_finished: A boolean, set to false for this initial step."""
+
+CONTINUE_SYSTEM = """The user previously reached a session summary point for their chosen path but wants to continue learning on the SAME path.
+Generate the NEXT logical learning item (material and question) based on their profile and the path.
+
+Task: Generate the next step. Keep material concise and question engaging.
+
+Output ONLY the required valid JSON object:
+{
+  "material": "...",
+  "question_for_user": "...",
+  "session_finished": false,
+  "summary": null
+}"""
+
+ASSESS_ANSWER_SYSTEM = """You are an AI Tutor assessing a user's answer during a learning session.
+
+Task:
+1. Analyze the user's latest answer based on the previous question, their profile (familiarity_level), and their learning_goal.
+2. Decide if the session should continue with the next logical step in the chosen path OR if the session should end (e.g., the path's objective for this short session is met, user seems stuck, user indicates wanting to stop).
+3. Generate a JSON response based on your decision:
+   - If CONTINUING: Set 'session_finished' to false. Provide the NEXT piece of 'material' and 'question_for_user'. Set 'summary' to null.
+   - If ENDING: Set 'session_finished' to true. Set 'material' and 'question_for_user' to null. Provide a 'summary' which MUST be a JSON object containing:
+""" + SUMMARY_FIELDS + """
+
+Output ONLY the required valid JSON object adhering to this structure:
+{
+  "material": "..." or null,
+  "question_for_user": "..." or null,
+  "session_finished": boolean,
+  "summary": { "recap": "...", "strengths": "...", "areas_for_improvement": "...", "next_step_suggestion": "...", "motivation": "..." } or null
+}"""
+
+
+# --- Per-request parts ---
+
+def learning_paths_prompt(profile_block):
+    return Prompt("learning_paths", LEARNING_PATHS_SYSTEM,
+                  f"User Profile Analysis:\n{profile_block}", LEARNING_PATHS_SCHEMA)
+
+
+def start_quiz_prompt(profile_block, chosen_path):
+    return Prompt("start_quiz", START_QUIZ_SYSTEM,
+                  f"User Profile Analysis:\n{profile_block}\n\nChosen Learning Path: \"{chosen_path}\"",
+                  FIRST_ITEM_SCHEMA)
+
+
+def submit_answer_prompt(profile_block, chosen_path, current_interaction, user_answer, history_block=""):
+    history_section = f"\n\nEarlier in this session:\n{history_block}" if history_block else ""
+    last_step = (f"Material Presented: {current_interaction.get('material', 'N/A')}\n"
+                 f"Question Asked: {current_interaction.get('question_for_user', 'N/A')}")
+    context = f"User Profile Analysis:\n{profile_block}\n\nChosen Learning Path: \"{chosen_path}\"{history_section}"
+
+    if user_answer == "SYSTEM_CONTINUE_SIGNAL":
+        return Prompt("continue", CONTINUE_SYSTEM,
+                      f"{context}\n\nLast Interaction (before summary):\n{last_step}", NEXT_STEP_SCHEMA)
+    return Prompt("assess_answer", ASSESS_ANSWER_SYSTEM,
+                  f"{context}\n\nPrevious Interaction Step:\n{last_step}\n\nUser's Latest Answer: \"{user_answer}\"",
+                  NEXT_STEP_SCHEMA)
+
+
+REPAIR_SYSTEM = """You fix malformed JSON produced by another model call.
+You are given a JSON schema, the problems found and the broken output.
+Return ONLY the corrected JSON. Keep all existing content; fill missing fields minimally."""
+
+
+def repair_prompt(raw_text, schema, errors):
+    """Small follow-up prompt that fixes a broken reply instead of regenerating it."""
+    problems = "; ".join(errors) if errors else "not valid JSON"
+    return Prompt("repair", REPAIR_SYSTEM,
+                  f"Schema:\n{json.dumps(schema, separators=(',', ':'))}\n\n"
+                  f"Problems: {problems}\n\nOutput:\n{raw_text[:8000]}", schema)
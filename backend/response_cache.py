@@ -0,0 +1,153 @@
+import os
+import re
+import json
+import time
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+
+from session_store import atomic_write_json
+from telemetry import get_logger
+
+# Cache for model responses that depend only on the learner's profile
+# (currently /api/get_learning_paths). Near-identical profiles -- same goal,
+# level and styles with different casing, spacing or style order -- map to
+# the same key, so repeated path requests never reach the model. Expired
+# entries stay (until evicted) so they can still be served with
+# allow_stale=True while the model is unavailable.
+
+PATHS_CACHE_TTL = float(os.environ.get("PATHS_CACHE_TTL", 6 * 3600))  # seconds
+PATHS_CACHE_MAX_BYTES = int(os.environ.get("PATHS_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+PATHS_CACHE_FILE = os.environ.get("PATHS_CACHE_FILE", "")  # empty = memory only
+PATHS_CACHE_SAVE_INTERVAL = float(os.environ.get("PATHS_CACHE_SAVE_INTERVAL", 60))  # seconds
+
+log = get_logger("response_cache")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def canonicalize(value):
+    """Normalizes a profile: sorted keys, lowercased and whitespace-collapsed strings, sorted string lists."""
+    if isinstance(value, dict):
+        return {str(k): canonicalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, list):
+        items = [canonicalize(v) for v in value]
+        if all(isinstance(v, str) for v in items):
+            items.sort()  # style order carries no meaning
+        return items
+    if isinstance(value, str):
+        return _WHITESPACE.sub(" ", value).strip().lower()
+    return value
+
+
+def profile_key(namespace, analysis):
+    """Stable cache key for a profile within a namespace (e.g. 'paths:v1')."""
+    canonical = json.dumps(canonicalize(analysis), sort_keys=True, separators=(',', ':'))
+    return f"{namespace}:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+
+
+class ResponseCache:
+    """LRU cache with a TTL and a cap on total serialized size, optionally persisted to disk."""
+
+    def __init__(self, ttl=PATHS_CACHE_TTL, max_bytes=PATHS_CACHE_MAX_BYTES,
+                 persist_path=PATHS_CACHE_FILE, save_interval=PATHS_CACHE_SAVE_INTERVAL):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.persist_path = persist_path
+        self.save_interval = save_interval
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stale_hits = 0
+        self._evictions = 0
+        self._dirty = False
+        self._last_save = time.time()
+        if persist_path:
+            self._load()
+            atexit.register(self.save)
+
+    def get(self, key, allow_stale=False):
+        """Cached value for key, or None; allow_stale also returns an expired value."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[0] < now and not allow_stale):
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if entry[0] < now:
+                self._stale_hits += 1
+            else:
+                self._hits += 1
+            return entry[2]
+
+    def put(self, key, value):
+        size = len(json.dumps(value, separators=(',', ':')))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.time() + self.ttl, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._evictions += 1
+            self._dirty = True
+            save_due = self.persist_path and time.time() - self._last_save >= self.save_interval
+        if save_due:
+            self.save()
+
+    def _drop(self, key):
+        # Caller holds self._lock
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _load(self):
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, 'r') as f:
+                saved = json.load(f)
+        except (IOError, ValueError) as e:
+            log.error("Error reading response cache file: %s", e)
+            return
+        now = time.time()
+        for key, expires_at, value in saved:
+            if expires_at > now:
+                size = len(json.dumps(value, separators=(',', ':')))
+                self._entries[key] = (expires_at, size, value)
+                self._bytes += size
+
+    def save(self):
+        """Writes unexpired entries to persist_path (temp file + rename)."""
+        if not self.persist_path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            now = time.time()
+            snapshot = [[k, e[0], e[2]] for k, e in self._entries.items() if e[0] > now]
+            self._dirty = False
+            self._last_save = now
+        try:
+            atomic_write_json(self.persist_path, snapshot)
+        except (IOError, OSError) as e:
+            log.error("Error writing response cache file: %s", e)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "stale_hits": self._stale_hits,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
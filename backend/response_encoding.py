@@ -0,0 +1,108 @@
+import os
+import gzip
+
+try:
+    import brotli
+except ImportError:  # optional: pip install Brotli to offer br
+    brotli = None
+
+# Fewer bytes on the wire for the JSON endpoints. compress_response() is an
+# after_request hook: a response is compressed with whichever of br/gzip the
+# client's Accept-Encoding prefers, once its body is at least
+# COMPRESS_MIN_BYTES (smaller bodies fit in a packet either way). Streamed
+# responses (the SSE endpoints) are left alone so events are never held back
+# in a compressor buffer.
+#
+# Clients can also opt into lean bodies with "Prefer: return=minimal" (or
+# ?lean=1): null fields are dropped, as are success messages and anything
+# the client already has.
+
+COMPRESS_ENABLED = os.environ.get("COMPRESS_ENABLED", "1") == "1"
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+COMPRESS_GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", 6))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", 5))  # 11 is too slow per request
+
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/plain", "text/html", "text/css", "application/javascript"}
+
+
+def accepted_encodings(header):
+    """{coding: q} from an Accept-Encoding header."""
+    accepted = {}
+    for item in (header or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def negotiate_encoding(header):
+    """'br', 'gzip' or None for an Accept-Encoding header (br wins ties)."""
+    accepted = accepted_encodings(header)
+    wildcard = accepted.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress_response(response, accept_encoding):
+    """Compresses a buffered response in place when it is worth it; returns the response."""
+    if not COMPRESS_ENABLED or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+    if (response.direct_passthrough or response.is_streamed or "Content-Encoding" in response.headers
+            or response.status_code < 200 or response.status_code in (204, 304)):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    coding = negotiate_encoding(accept_encoding)
+    if coding == "br":
+        response.set_data(brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY))
+    elif coding == "gzip":
+        response.set_data(gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL))
+    else:
+        return response
+    response.headers["Content-Encoding"] = coding
+    return response
+
+
+# --- Lean bodies ---
+
+def wants_lean(request):
+    """True if the client asked for minimal bodies."""
+    prefer = request.headers.get("Prefer", "")
+    if any(p.strip().lower() == "return=minimal" for p in prefer.split(",")):
+        return True
+    return request.args.get("lean") == "1"
+
+
+def drop_nulls(value):
+    """value with None-valued object fields removed, recursively."""
+    if isinstance(value, dict):
+        return {k: drop_nulls(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [drop_nulls(v) for v in value]
+    return value
+
+
+def lean_payload(payload):
+    """A success body without nulls or its human-readable message."""
+    return {k: v for k, v in drop_nulls(payload).items() if k != "message"}
+
+
+def unsent_fields(interaction, sent):
+    """The non-null fields of interaction whose value differs from what was already sent ({key: value})."""
+    return {k: v for k, v in drop_nulls(interaction).items() if k not in sent or sent[k] != v}
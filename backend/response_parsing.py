@@ -0,0 +1,248 @@
+import os
+import json
+
+# Parsing of model replies. Where the model supports it we ask for
+# schema-constrained JSON (response_schema below), so most replies parse on
+# the json.loads fast path. Anything else goes through extract_json(), which
+# finds the outermost JSON value in the text (skipping brackets in the
+# surrounding prose), drops trailing commas and closes a truncated reply,
+# and is then validated against the endpoint's schema. Only if that fails do
+# callers spend one small repair call (prompts.repair_prompt) instead of
+# regenerating the whole reply.
+
+LLM_STRUCTURED_OUTPUT = os.environ.get("LLM_STRUCTURED_OUTPUT", "1") == "1"
+LLM_REPAIR_RETRY = os.environ.get("LLM_REPAIR_RETRY", "1") == "1"
+
+
+class ResponseParseError(ValueError):
+    """A model reply that could not be parsed or does not match its schema."""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+# --- Schemas (OpenAPI subset accepted by Gemini's response_schema) ---
+
+_STRING = {"type": "string"}
+_NULLABLE_STRING = {"type": "string", "nullable": True}
+
+LEARNING_PATHS_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"name": _STRING, "duration": _STRING, "overview": _STRING},
+        "required": ["name", "duration", "overview"],
+    },
+}
+
+FIRST_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "material": _STRING,
+        "question_for_user": _STRING,
+        "session_finished": {"type": "boolean"},
+    },
+    "required": ["material", "question_for_user", "session_finished"],
+}
+
+# A summary, when present, must be complete: a truncated one fails
+# validation so the caller's repair call gets a chance to fix it.
+NEXT_STEP_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "material": _NULLABLE_STRING,
+        "question_for_user": _NULLABLE_STRING,
+        "session_finished": {"type": "boolean"},
+        "summary": {
+            "type": "object",
+            "nullable": True,
+            "properties": {
+                "recap": _STRING,
+                "strengths": _STRING,
+                "areas_for_improvement": _STRING,
+                "next_step_suggestion": _STRING,
+                "motivation": _STRING,
+            },
+            "required": ["recap", "strengths", "areas_for_improvement", "next_step_suggestion", "motivation"],
+        },
+    },
+    "required": ["material", "question_for_user", "session_finished", "summary"],
+}
+
+
+def generation_config(schema):
+    """generation_config asking the model for JSON matching schema (None when disabled)."""
+    if not schema or not LLM_STRUCTURED_OUTPUT:
+        return None
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+
+# --- Validation ---
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "integer": int,
+    "number": (int, float),
+}
+
+
+def validate(value, schema, path="$"):
+    """Returns a list of 'path: problem' strings (empty when value matches schema)."""
+    if value is None:
+        return [] if schema.get("nullable") else [f"{path}: is null"]
+    expected = _TYPES[schema["type"]]
+    if not isinstance(value, expected) or (schema["type"] != "boolean" and isinstance(value, bool)):
+        return [f"{path}: expected {schema['type']}"]
+    errors = []
+    if schema["type"] == "object":
+        errors += [f"{path}: missing '{key}'" for key in schema.get("required", []) if key not in value]
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in value:
+                errors += validate(value[key], sub_schema, f"{path}.{key}")
+    elif schema["type"] == "array" and "items" in schema:
+        for i, item in enumerate(value):
+            errors += validate(item, schema["items"], f"{path}[{i}]")
+    return errors
+
+
+# --- Tolerant extraction ---
+
+EXTRACT_MAX_CANDIDATES = 16  # bracket positions tried before giving up
+
+
+def _next_bracket(text, start):
+    starts = [i for i in (text.find('{', start), text.find('[', start)) if i != -1]
+    return min(starts) if starts else -1
+
+
+def extract_json(text, schema=None):
+    """
+    Returns the outermost JSON object/array in text.
+
+    Prose or code fences around the value are ignored, trailing commas are
+    dropped, and a truncated value is closed: first by closing an open string
+    and the open brackets, otherwise by cutting back to the last complete
+    value. Brackets in the prose (e.g. "see [1]: {...}") are skipped by
+    trying each candidate value in turn: the first that matches schema wins,
+    else (or without a schema) the largest one that parsed. Raises
+    ResponseParseError if no JSON value is found.
+    """
+    start = _next_bracket(text, 0)
+    if start == -1:
+        raise ResponseParseError("No JSON value found in AI response.")
+    best = first_error = None  # best: (span, value)
+    for _ in range(EXTRACT_MAX_CANDIDATES):
+        try:
+            value, end = _scan_value(text, start)
+        except ResponseParseError as e:
+            first_error = first_error or e
+            start = _next_bracket(text, start + 1)
+        else:
+            if schema and not validate(value, schema):
+                return value
+            if best is None or end - start > best[0]:
+                best = (end - start, value)
+            start = _next_bracket(text, end)
+        if start == -1:
+            break
+    if best is not None:
+        return best[1]
+    raise first_error
+
+
+def _scan_value(text, start):
+    """One pass over the JSON value starting at text[start]: returns (value, end index)."""
+    out = []
+    closers = []  # expected closing brackets, innermost last
+    key_next = []  # per open container: the next string is an object key
+    in_string = escape = string_is_key = False
+    pending_comma = False
+    safe_len, safe_closers = 0, ""
+    stop = len(text)  # where scanning ended, for the caller's next candidate
+
+    for end in range(start, len(text)):
+        ch = text[end]
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+                if not string_is_key:
+                    safe_len, safe_closers = len(out), "".join(reversed(closers))
+            continue
+        if ch.isspace():
+            continue
+        if pending_comma:
+            pending_comma = False
+            if ch not in '}]':  # a comma before a closer is a trailing comma: drop it
+                out.append(',')
+        if ch == '"':
+            in_string = True
+            string_is_key = bool(closers) and closers[-1] == '}' and key_next[-1]
+            out.append(ch)
+        elif ch in '{[':
+            out.append(ch)
+            closers.append('}' if ch == '{' else ']')
+            key_next.append(ch == '{')
+            safe_len, safe_closers = len(out), "".join(reversed(closers))
+        elif ch in '}]':
+            if not closers or ch != closers[-1]:
+                stop = end
+                break
+            out.append(ch)
+            closers.pop()
+            key_next.pop()
+            if not closers:
+                try:
+                    return json.loads("".join(out)), end + 1
+                except ValueError:
+                    raise ResponseParseError("AI response contains invalid JSON.")
+            safe_len, safe_closers = len(out), "".join(reversed(closers))
+        elif ch == ',':
+            if not closers:
+                stop = end
+                break
+            safe_len, safe_closers = len(out), "".join(reversed(closers))
+            pending_comma = True
+            key_next[-1] = closers[-1] == '}'
+        elif ch == ':':
+            out.append(ch)
+            if key_next:
+                key_next[-1] = False
+        else:
+            out.append(ch)  # number / true / false / null
+
+    # Truncated: try to keep the partial last value, else cut back to the last complete one
+    tail = "".join(out)
+    if in_string:
+        tail = (tail[:-1] if escape else tail) + '"'
+    try:
+        return json.loads(tail + "".join(reversed(closers))), stop
+    except ValueError:
+        pass
+    try:
+        return json.loads("".join(out[:safe_len]) + safe_closers), stop
+    except ValueError:
+        raise ResponseParseError("AI response JSON could not be repaired.")
+
+
+def parse_model_output(text, schema=None):
+    """Parses (fast path, then tolerant extraction) and validates a model reply."""
+    text = text.strip()
+    try:
+        value = json.loads(text)
+    except ValueError:
+        value = extract_json(text, schema)
+    if schema:
+        errors = validate(value, schema)
+        if errors:
+            raise ResponseParseError("AI response does not match the expected structure.", errors)
+    return value
+
@@ -0,0 +1,469 @@
+import os
+import json
+import time
+import uuid
+import atexit
+import sqlite3
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from telemetry import get_logger
+
+# Session state used to live in a single memory.json shared by every user.
+# Each session now gets its own record, keyed by an id the API issues from
+# /api/analyze_form, with a small in-process LRU tier in front of SQLite.
+
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "sqlite")  # "sqlite" or "file"
+SESSION_DB_FILE = os.environ.get("SESSION_DB_FILE", "sessions.db")
+SESSION_SNAPSHOT_FILE = os.environ.get("SESSION_SNAPSHOT_FILE", "sessions.json")
+SESSION_JOURNAL_FILE = os.environ.get("SESSION_JOURNAL_FILE", "sessions.journal.jsonl")
+SESSION_CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE", 1024))
+
+# Write-behind: updates stay in memory and are flushed in batches. Opt-in,
+# and only honoured with a single worker process: its cached reads never
+# check the backend, so a second worker's writes would be overwritten.
+SESSION_WRITE_BEHIND = os.environ.get("SESSION_WRITE_BEHIND", "0") == "1"
+SESSION_FLUSH_INTERVAL = float(os.environ.get("SESSION_FLUSH_INTERVAL", 0.5))  # seconds
+SESSION_FLUSH_BATCH = int(os.environ.get("SESSION_FLUSH_BATCH", 64))  # dirty sessions
+SESSION_COMPACT_EVERY = int(os.environ.get("SESSION_COMPACT_EVERY", 5000))  # journal records
+
+log = get_logger("sessions")
+
+
+def new_session_id():
+    """Returns a fresh, unguessable session id."""
+    return uuid.uuid4().hex
+
+
+# --- Durable Backends ---
+
+class SQLiteBackend:
+    """Stores one JSON row per session in a table (default: sessions) of a WAL-mode SQLite file."""
+
+    def __init__(self, path=SESSION_DB_FILE, table="sessions"):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table}")
+        self.path = path
+        self.table = table
+        self._local = threading.local()
+        self._conn().execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            " id TEXT PRIMARY KEY,"
+            " version INTEGER NOT NULL,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        # sqlite3 connections can't be shared across threads or processes,
+        # so each gunicorn thread keeps its own.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():  # never reuse one inherited across fork
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def version(self, session_id):
+        """Returns the stored version of a session, or None if it doesn't exist."""
+        row = self._conn().execute(
+            f"SELECT version FROM {self.table} WHERE id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def load(self, session_id):
+        """Returns (version, data) for a session, or (None, None) if missing."""
+        row = self._conn().execute(
+            f"SELECT version, data FROM {self.table} WHERE id = ?", (session_id,)
+        ).fetchone()
+        if not row:
+            return None, None
+        return row[0], json.loads(row[1])
+
+    def save(self, session_id, data):
+        """Writes a session and returns its new version."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                f"INSERT INTO {self.table} (id, version, data, updated_at) VALUES (?, 1, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET version = version + 1, data = excluded.data, "
+                "updated_at = excluded.updated_at",
+                (session_id, json.dumps(data, separators=(',', ':')), time.time())
+            )
+            version = conn.execute(
+                f"SELECT version FROM {self.table} WHERE id = ?", (session_id,)
+            ).fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return version
+
+    def save_many(self, records):
+        """Writes a batch of (session_id, data) pairs in one transaction; data=None deletes."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for session_id, data in records:
+                if data is None:
+                    conn.execute(f"DELETE FROM {self.table} WHERE id = ?", (session_id,))
+                    continue
+                conn.execute(
+                    f"INSERT INTO {self.table} (id, version, data, updated_at) VALUES (?, 1, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET version = version + 1, data = excluded.data, "
+                    "updated_at = excluded.updated_at",
+                    (session_id, json.dumps(data, separators=(',', ':')), now)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, session_id):
+        self._conn().execute(f"DELETE FROM {self.table} WHERE id = ?", (session_id,))
+
+
+def atomic_write_json(path, data):
+    """Writes JSON to a temp file in the same directory, fsyncs, then renames over path."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class FileBackend:
+    """
+    Snapshot + JSON-lines journal, for deployments without SQLite.
+
+    Every batch is appended to the journal (one compact line per session) and
+    fsynced; once the journal grows past SESSION_COMPACT_EVERY records the full
+    state is rewritten to the snapshot with temp-file-plus-rename and the
+    journal is truncated. Startup loads the snapshot and replays only the
+    journal tail. A torn last line from a crash is ignored.
+
+    The whole index lives in this process, so build_session_store() only
+    uses it with a single worker process.
+    """
+
+    def __init__(self, snapshot_path=SESSION_SNAPSHOT_FILE, journal_path=SESSION_JOURNAL_FILE,
+                 compact_every=SESSION_COMPACT_EVERY):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._sessions = {}  # session_id -> (version, data)
+        self._journal_records = 0
+        self._recover()
+        self._journal = open(self.journal_path, 'a')
+
+    def _recover(self):
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, 'r') as f:
+                    for session_id, entry in json.load(f).items():
+                        self._sessions[session_id] = (entry['v'], entry['data'])
+            except (IOError, ValueError, KeyError) as e:
+                log.error("Error reading session snapshot: %s", e)
+        if os.path.exists(self.journal_path):
+            good_offset = 0
+            with open(self.journal_path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    self._apply(record['id'], record.get('data'))
+                    self._journal_records += 1
+                    good_offset += len(line)
+            if good_offset < os.path.getsize(self.journal_path):
+                # Drop the torn tail so new records aren't appended after it
+                log.warning("Dropping torn record at end of session journal.")
+                with open(self.journal_path, 'r+b') as f:
+                    f.truncate(good_offset)
+
+    def _apply(self, session_id, data):
+        if data is None:
+            self._sessions.pop(session_id, None)
+            return None
+        version = self._sessions.get(session_id, (0, None))[0] + 1
+        self._sessions[session_id] = (version, data)
+        return version
+
+    def version(self, session_id):
+        entry = self._sessions.get(session_id)
+        return entry[0] if entry else None
+
+    def load(self, session_id):
+        return self._sessions.get(session_id, (None, None))
+
+    def save_many(self, records):
+        with self._lock:
+            lines = []
+            for session_id, data in records:
+                self._apply(session_id, data)
+                lines.append(json.dumps({"id": session_id, "data": data}, separators=(',', ':')))
+            self._journal.write('\n'.join(lines) + '\n')
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journal_records += len(lines)
+            if self._journal_records >= self.compact_every:
+                self._compact()
+
+    def save(self, session_id, data):
+        self.save_many([(session_id, data)])
+        return self.version(session_id)
+
+    def delete(self, session_id):
+        self.save_many([(session_id, None)])
+
+    def _compact(self):
+        snapshot = {sid: {"v": v, "data": data} for sid, (v, data) in self._sessions.items()}
+        atomic_write_json(self.snapshot_path, snapshot)
+        self._journal.close()
+        self._journal = open(self.journal_path, 'w')
+        self._journal_records = 0
+
+
+# --- Session Store ---
+
+class SessionStore:
+    """
+    Per-session state with an LRU cache in front of a durable backend.
+
+    Reads hit the cache when the backend still reports the cached version,
+    so another gunicorn worker writing the same session is never missed.
+    Writes for one session are serialized with a per-key lock; different
+    sessions never block each other.
+    """
+
+    def __init__(self, backend, cache_size=SESSION_CACHE_SIZE):
+        self.backend = backend
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # session_id -> (version, data)
+        self._cache_lock = threading.Lock()
+        self._key_locks = weakref.WeakValueDictionary()
+        self._key_locks_guard = threading.Lock()
+
+    def _key_lock(self, session_id):
+        with self._key_locks_guard:
+            lock = self._key_locks.get(session_id)
+            if lock is None:
+                lock = threading.RLock()
+                self._key_locks[session_id] = lock
+            return lock
+
+    def _cache_get(self, session_id):
+        with self._cache_lock:
+            entry = self._cache.get(session_id)
+            if entry is not None:
+                self._cache.move_to_end(session_id)
+            return entry
+
+    def _cache_put(self, session_id, version, data):
+        with self._cache_lock:
+            self._cache[session_id] = (version, data)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _read(self, session_id):
+        entry = self._cache_get(session_id)
+        if entry is not None and self.backend.version(session_id) == entry[0]:
+            return entry[1]
+        version, data = self.backend.load(session_id)
+        if version is None:
+            return None
+        self._cache_put(session_id, version, data)
+        return data
+
+    def exists(self, session_id):
+        return bool(session_id) and self.backend.version(session_id) is not None
+
+    def get(self, session_id):
+        """Returns a copy of the session state, or an empty dict if unknown."""
+        if not session_id:
+            return {}
+        data = self._read(session_id)
+        return json.loads(json.dumps(data)) if data else {}
+
+    def put(self, session_id, data):
+        """Replaces the whole session state."""
+        with self._key_lock(session_id):
+            version = self.backend.save(session_id, data)
+            self._cache_put(session_id, version, data)
+
+    def put_many(self, items):
+        """Replaces many sessions, given as (session_id, data) pairs, in one backend transaction."""
+        self.backend.save_many(items)
+        with self._cache_lock:
+            for session_id, _ in items:
+                self._cache.pop(session_id, None)
+
+    @contextmanager
+    def update(self, session_id):
+        """
+        Read-modify-write for one session under its lock:
+
+            with store.update(session_id) as state:
+                state['chosen_path'] = name
+        """
+        with self._key_lock(session_id):
+            state = self.get(session_id)
+            yield state
+            self.put(session_id, state)
+
+    def delete(self, session_id):
+        with self._key_lock(session_id):
+            self.backend.delete(session_id)
+            with self._cache_lock:
+                self._cache.pop(session_id, None)
+
+    def flush(self):
+        """No-op for the write-through store; kept so callers can flush any store."""
+
+
+class WriteBehindStore(SessionStore):
+    """
+    SessionStore that acknowledges writes once they are in memory.
+
+    Dirty sessions are collected and written to the backend in one batch
+    every SESSION_FLUSH_INTERVAL seconds, or sooner once SESSION_FLUSH_BATCH
+    sessions are pending. Only the latest state of a session is flushed, so
+    a burst of turns costs one backend write. This process is the owner of
+    the sessions it serves, so build_session_store() only uses it with a
+    single worker process.
+    The flusher thread starts with the first write, in the worker making it.
+    """
+
+    def __init__(self, backend, cache_size=SESSION_CACHE_SIZE,
+                 flush_interval=SESSION_FLUSH_INTERVAL, flush_batch=SESSION_FLUSH_BATCH):
+        super().__init__(backend, cache_size)
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._pending = {}  # session_id -> data (None = delete)
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._flusher_pid = None
+        atexit.register(self.close)
+
+    def _ensure_flusher(self):
+        if self._flusher_pid != os.getpid():
+            with self._flush_lock:
+                if self._flusher_pid != os.getpid():
+                    threading.Thread(target=self._flush_loop, name='session-flusher', daemon=True).start()
+                    self._flusher_pid = os.getpid()
+
+    def _read(self, session_id):
+        with self._pending_lock:
+            if session_id in self._pending:
+                return self._pending[session_id]
+        entry = self._cache_get(session_id)
+        if entry is not None:
+            return entry[1]
+        version, data = self.backend.load(session_id)
+        if version is None:
+            return None
+        self._cache_put(session_id, version, data)
+        return data
+
+    def exists(self, session_id):
+        return bool(session_id) and self._read(session_id) is not None
+
+    def put(self, session_id, data):
+        self._ensure_flusher()
+        with self._key_lock(session_id):
+            entry = self._cache_get(session_id)
+            self._cache_put(session_id, (entry[0] if entry else 0) + 1, data)
+            with self._pending_lock:
+                self._pending[session_id] = data
+                pending = len(self._pending)
+        if pending >= self.flush_batch:
+            self._wakeup.set()
+
+    def put_many(self, items):
+        """Queues many sessions and flushes them (with anything else pending) in one batch before returning."""
+        with self._cache_lock:
+            for session_id, _ in items:
+                self._cache.pop(session_id, None)  # don't churn the LRU with a bulk import
+        with self._pending_lock:
+            self._pending.update(items)
+        self.flush()
+
+    def delete(self, session_id):
+        self._ensure_flusher()
+        with self._key_lock(session_id):
+            with self._cache_lock:
+                self._cache.pop(session_id, None)
+            with self._pending_lock:
+                self._pending[session_id] = None
+
+    def flush(self):
+        """Writes all pending sessions to the backend in one batch."""
+        with self._flush_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return
+            try:
+                self.backend.save_many(list(batch.items()))
+            except Exception as e:
+                log.error("Error flushing %d sessions: %s", len(batch), e)
+                # Put the batch back unless a newer write superseded it
+                with self._pending_lock:
+                    for session_id, data in batch.items():
+                        self._pending.setdefault(session_id, data)
+
+    def _flush_loop(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self):
+        self._stopped = True
+        self._wakeup.set()
+        self.flush()
+
+
+def build_session_store(table="sessions"):
+    """
+    Builds the session store configured by the SESSION_* environment
+    variables. table names a separate key space in the same backend (its own
+    SQLite table, or its own snapshot and journal files). The file backend
+    and write-behind keep state in one process, so with several workers
+    (WEB_CONCURRENCY > 1) they fall back to SQLite and write-through.
+    """
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    if SESSION_BACKEND == 'file' and workers == 1:
+        if table == "sessions":
+            backend = FileBackend()
+        else:
+            directory = os.path.dirname(SESSION_SNAPSHOT_FILE)
+            backend = FileBackend(os.path.join(directory, f"{table}.json"),
+                                  os.path.join(directory, f"{table}.journal.jsonl"))
+    else:
+        if SESSION_BACKEND == 'file':
+            log.warning("SESSION_BACKEND=file ignored with WEB_CONCURRENCY=%d; using SQLite sessions.", workers)
+        backend = SQLiteBackend(table=table)
+    if SESSION_WRITE_BEHIND:
+        if workers == 1:
+            return WriteBehindStore(backend)
+        log.warning("SESSION_WRITE_BEHIND ignored with WEB_CONCURRENCY=%d; using write-through sessions.", workers)
+    return SessionStore(backend)
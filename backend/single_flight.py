@@ -0,0 +1,206 @@
+import os
+import copy
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import threading
+
+# Single-flight coalescing of identical model calls. When several requests
+# need the same rendered prompt at once (a class told to start the same
+# topic, identical profiles hitting get_learning_paths), one of them makes
+# the call and the others wait for its parsed result.
+#
+# SINGLE_FLIGHT picks the scope:
+#   off     -- every request calls the model
+#   process -- concurrent callers in this worker share one call (default)
+#   shared  -- also across the workers on this host, through a small SQLite
+#              file: the first worker claims the key, the others poll for
+#              its result. A follower whose leader fails or takes longer than
+#              SINGLE_FLIGHT_WAIT makes the call itself.
+
+SINGLE_FLIGHT = os.environ.get("SINGLE_FLIGHT", "process")
+SINGLE_FLIGHT_DB_FILE = os.environ.get("SINGLE_FLIGHT_DB_FILE", "singleflight.db")
+SINGLE_FLIGHT_WAIT = float(os.environ.get("SINGLE_FLIGHT_WAIT", 30))  # seconds to wait on another worker
+SINGLE_FLIGHT_POLL = float(os.environ.get("SINGLE_FLIGHT_POLL", 0.05))  # seconds between polls
+SINGLE_FLIGHT_RESULT_TTL = float(os.environ.get("SINGLE_FLIGHT_RESULT_TTL", 5))  # seconds a shared result is kept
+
+
+def prompt_key(prompt):
+    """Hash of everything that determines a reply: template name, rendered text, schema and model."""
+    schema = json.dumps(getattr(prompt, "schema", None), sort_keys=True)
+    text = f"{getattr(prompt, 'name', '')}\0{prompt}\0{schema}\0{getattr(prompt, 'model', None) or ''}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Per-process coalescing: concurrent do() calls with the same key share one fn() call."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counts = {"leaders": 0, "followers": 0}
+
+    def do(self, key, fn):
+        """Returns fn()'s result (or raises its exception); followers get a copy of the leader's result."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._counts["leaders" if leader else "followers"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, scope="process", in_flight=len(self._calls))
+
+
+class SharedSingleFlight(SingleFlight):
+    """Coalesces within the process, then across workers through a SQLite table of claimed keys."""
+
+    def __init__(self, path=SINGLE_FLIGHT_DB_FILE, wait=SINGLE_FLIGHT_WAIT, poll=SINGLE_FLIGHT_POLL,
+                 result_ttl=SINGLE_FLIGHT_RESULT_TTL):
+        super().__init__()
+        self.path = path
+        self.wait = wait
+        self.poll = poll
+        self.result_ttl = result_ttl
+        self._owner = uuid.uuid4().hex
+        self._local = threading.local()
+        self._shared_counts = {"shared_leaders": 0, "shared_followers": 0, "shared_fallbacks": 0}
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS flights ("
+            " key TEXT PRIMARY KEY,"
+            " owner TEXT NOT NULL,"
+            " started_at REAL NOT NULL,"
+            " finished_at REAL,"
+            " result TEXT)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():  # never reuse one inherited across fork
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, key):
+        with self._lock:
+            self._shared_counts[key] += 1
+
+    def do(self, key, fn):
+        return super().do(key, lambda: self._do_shared(key, fn))
+
+    def _claim(self, key, owner):
+        """('leader', None), ('done', result) or ('wait', None)."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT started_at, finished_at, result FROM flights WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                started_at, finished_at, result = row
+                if finished_at is not None and finished_at >= now - self.result_ttl:
+                    conn.execute("COMMIT")
+                    return "done", json.loads(result)
+                if finished_at is None and started_at >= now - self.wait:
+                    conn.execute("COMMIT")
+                    return "wait", None
+            # Free, expired, or abandoned by a crashed worker: take it
+            conn.execute("INSERT OR REPLACE INTO flights (key, owner, started_at) VALUES (?, ?, ?)", (key, owner, now))
+            conn.execute("DELETE FROM flights WHERE finished_at < ?", (now - self.result_ttl,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return "leader", None
+
+    def _do_shared(self, key, fn):
+        owner = f"{self._owner}:{threading.get_ident()}"
+        deadline = time.monotonic() + self.wait
+        while True:
+            state, result = self._claim(key, owner)
+            if state == "done":
+                self._count("shared_followers")
+                return result
+            if state == "leader":
+                break
+            # Another worker is calling: poll for its result until our own deadline
+            while time.monotonic() < deadline:
+                time.sleep(self.poll)
+                row = self._conn().execute("SELECT owner, finished_at, result FROM flights WHERE key = ?",
+                                           (key,)).fetchone()
+                if row is None:
+                    break  # the leader failed: try to claim it ourselves
+                if row[1] is not None:
+                    self._count("shared_followers")
+                    return json.loads(row[2])
+            else:
+                self._count("shared_fallbacks")
+                return fn()  # waited long enough; don't depend on a stuck worker
+
+        self._count("shared_leaders")
+        try:
+            result = fn()
+        except Exception:
+            self._conn().execute("DELETE FROM flights WHERE key = ? AND owner = ?", (key, owner))
+            raise
+        self._conn().execute("UPDATE flights SET finished_at = ?, result = ? WHERE key = ? AND owner = ?",
+                             (time.time(), json.dumps(result, separators=(',', ':')), key, owner))
+        return result
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update(self._shared_counts)
+        stats["scope"] = "shared"
+        return stats
+
+
+class NoSingleFlight:
+    """SINGLE_FLIGHT=off: calls straight through."""
+
+    def do(self, key, fn):
+        return fn()
+
+    def stats(self):
+        return {"scope": "off"}
+
+
+def build_single_flight(scope=SINGLE_FLIGHT):
+    """Builds the coalescer configured by SINGLE_FLIGHT."""
+    if scope == "shared":
+        return SharedSingleFlight()
+    if scope == "off":
+        return NoSingleFlight()
+    return SingleFlight()
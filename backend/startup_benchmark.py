@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+# Startup-time benchmark. Each run starts a fresh interpreter and times the
+# phases a gunicorn master goes through before it can fork workers -- import
+# the app module, create_app() (which warms the LLM client) -- plus the first
+# request served. The heavy LLM SDK must not be imported by `import app`
+# itself; the run reports whether it was.
+#
+# Pass budgets to turn it into a regression check (exit status 1 when over):
+#
+#   python startup_benchmark.py --runs 5
+#   python startup_benchmark.py --max-import-seconds 0.5 --max-total-seconds 2.5
+#   APP_WARM_LLM=0 python startup_benchmark.py
+
+PHASES = ("import_seconds", "create_app_seconds", "first_request_seconds", "total_seconds")
+
+FORM = {
+    "goal": "guitar",
+    "familiarity": "Beginner",
+    "styles": ["Visual"],
+    "timeAvailable": "15 mins",
+    "specificFocus": "",
+    "achieveGoal": "Build a habit",
+    "sessionScope": "One small topic",
+}
+
+
+def probe():
+    """Runs in the child interpreter: times one cold start and prints it as JSON."""
+    started = time.perf_counter()
+    import app as app_module
+    imported = time.perf_counter()
+    sdk_imported = "google.generativeai" in sys.modules
+    flask_app = app_module.create_app()
+    created = time.perf_counter()
+    response = flask_app.test_client().post("/api/analyze_form", json=FORM)
+    served = time.perf_counter()
+    print(json.dumps({
+        "import_seconds": imported - started,
+        "create_app_seconds": created - imported,
+        "first_request_seconds": served - created,
+        "total_seconds": served - started,
+        "sdk_imported_by_import": sdk_imported,
+        "first_request_status": response.status_code,
+    }))
+
+
+def run_once(env):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--probe"], env=env,
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time cold starts of the app.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to start")
+    parser.add_argument("--max-import-seconds", type=float, help="Fail if the median import time is above this")
+    parser.add_argument("--max-total-seconds", type=float, help="Fail if the median total time is above this")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.probe:
+        probe()
+        return 0
+
+    env = dict(os.environ)
+    scratch = tempfile.mkdtemp()
+    env.setdefault("SESSION_DB_FILE", os.path.join(scratch, "sessions.db"))
+    env.setdefault("PROGRESS_DB_FILE", os.path.join(scratch, "progress.db"))
+    env.setdefault("LOG_LEVEL", "WARNING")
+    runs = [run_once(env) for _ in range(args.runs)]
+
+    summary = {phase: {"median": statistics.median(r[phase] for r in runs), "max": max(r[phase] for r in runs)}
+               for phase in PHASES}
+    print(f"{'phase':<24}{'median':>10}{'max':>10}")
+    for phase in PHASES:
+        print(f"{phase:<24}{summary[phase]['median'] * 1000:>8.0f}ms{summary[phase]['max'] * 1000:>8.0f}ms")
+    sdk_imported = any(r["sdk_imported_by_import"] for r in runs)
+    print(f"LLM SDK imported by `import app`: {'yes' if sdk_imported else 'no'}")
+
+    failures = []
+    if sdk_imported:
+        failures.append("`import app` imports the LLM SDK; it should load on first use or in create_app()")
+    if any(r["first_request_status"] != 200 for r in runs):
+        failures.append("the first request did not return 200")
+    if args.max_import_seconds is not None and summary["import_seconds"]["median"] > args.max_import_seconds:
+        failures.append(f"median import time is over {args.max_import_seconds}s")
+    if args.max_total_seconds is not None and summary["total_seconds"]["median"] > args.max_total_seconds:
+        failures.append(f"median total time is over {args.max_total_seconds}s")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "runs": runs, "summary": summary, "failures": failures}, f, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+import json
+
+# Helpers for the /stream endpoints: an incremental parser for the model's
+# JSON object and server-sent event formatting.
+
+
+def sse_event(event, data):
+    """Formats one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class IncrementalFieldParser:
+    """
+    Parses a streamed top-level JSON object one chunk at a time.
+
+    feed() returns a list of events:
+      ("delta", key, text)   -- new decoded text of a string value that is
+                                still streaming (only for keys in stream_keys)
+      ("field", key, value)  -- a top-level field whose value just completed
+
+    Anything before the opening '{' (e.g. a ```json fence) is skipped.
+    """
+
+    def __init__(self, stream_keys=("material",)):
+        self.stream_keys = set(stream_keys)
+        self._buf = ""
+        self._pos = 0
+        self._started = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key = None  # key whose value we're reading
+        self._pending_key = None  # raw key text once its string closes
+        self._key_start = None
+        self._value_start = None
+        self._value_is_string = False
+        self._streamed_upto = None  # raw offset already emitted as delta
+
+    def feed(self, chunk):
+        events = []
+        self._buf += chunk
+        buf = self._buf
+        while self._pos < len(buf) and not self._done:
+            ch = buf[self._pos]
+            if not self._started:
+                if ch == '{':
+                    self._started = True
+                    self._depth = 1
+                self._pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._close_string(events)
+                self._pos += 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None:
+                    self._key_start = self._pos
+                elif self._depth == 1 and self._value_start is None:
+                    self._value_start = self._pos
+                    self._value_is_string = True
+                    self._streamed_upto = self._pos + 1
+            elif ch == ':' and self._depth == 1 and self._key is None:
+                self._key = self._pending_key
+            elif ch in '{[':
+                if self._depth == 1 and self._key is not None and self._value_start is None:
+                    self._value_start = self._pos
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None and not self._value_is_string:
+                    self._finish_value(self._pos + 1, events)
+                elif self._depth == 0:
+                    self._finish_value(self._pos, events)
+                    self._done = True
+            elif ch == ',' and self._depth == 1:
+                self._finish_value(self._pos, events)
+            elif not ch.isspace() and self._depth == 1 and self._key is not None and self._value_start is None:
+                self._value_start = self._pos  # number / true / false / null
+            self._pos += 1
+
+        if self._in_string and self._value_is_string and self._key in self.stream_keys:
+            self._emit_delta(events)
+        return events
+
+    def _close_string(self, events):
+        if self._depth != 1:
+            return
+        if self._key is None and self._key_start is not None:
+            self._pending_key = json.loads(self._buf[self._key_start:self._pos + 1])
+            self._key_start = None
+        elif self._value_is_string:
+            if self._key in self.stream_keys:
+                self._emit_delta(events, closing=True)
+            self._finish_value(self._pos + 1, events)
+
+    def _emit_delta(self, events, closing=False):
+        end = self._pos if closing else len(self._buf)
+        raw = self._buf[self._streamed_upto:end]
+        if not closing:
+            raw = _safe_escape_prefix(raw)
+        if raw:
+            events.append(("delta", self._key, json.loads('"' + raw + '"')))
+            self._streamed_upto += len(raw)
+
+    def _finish_value(self, end, events):
+        if self._key is None or self._value_start is None:
+            return
+        raw = self._buf[self._value_start:end].strip()
+        if raw:
+            events.append(("field", self._key, json.loads(raw)))
+        self._key = None
+        self._pending_key = None
+        self._value_start = None
+        self._value_is_string = False
+        self._streamed_upto = None
+
+
+def _safe_escape_prefix(raw):
+    """Trims raw JSON string text so it doesn't end inside an escape sequence or surrogate pair."""
+    backslash = raw.rfind('\\')
+    if backslash != -1:
+        # Count the run of backslashes ending at this position
+        run_start = backslash
+        while run_start > 0 and raw[run_start - 1] == '\\':
+            run_start -= 1
+        if (backslash - run_start) % 2 == 0:  # this backslash starts an escape
+            needed = 6 if raw[backslash + 1:backslash + 2] == 'u' else 2
+            if len(raw) - backslash < needed:
+                raw = raw[:backslash]
+    # Hold back a lone high surrogate until its pair arrives
+    if len(raw) >= 6 and raw[-6:-4].lower() == '\\u' and raw[-4:-3].lower() == 'd' and raw[-3:-2].lower() in '89ab':
+        return raw[:-6]
+    return raw
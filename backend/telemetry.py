@@ -0,0 +1,206 @@
+import os
+import time
+import random
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Hot-path instrumentation. Every request gets a trace (see the before/after
+# hooks in app.py); code inside it wraps each phase in span("phase") and
+# the durations land in Prometheus-style histograms that /metrics renders in
+# the text exposition format, with no client library needed. Phases:
+# parse_request, state_read, cache_lookup, prompt_build, model_call,
+# parse_response, state_write, compress. METRICS_SAMPLE_RATE times only a
+# fraction of requests' phases; request totals are always recorded.
+#
+# Logging goes through get_logger(): leveled (LOG_LEVEL) and rate limited
+# per call site, so an error storm can't flood the logs. Full prompt and reply
+# dumps are off unless LOG_PROMPTS=1.
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+METRICS_SAMPLE_RATE = float(os.environ.get("METRICS_SAMPLE_RATE", 1.0))  # fraction of requests with phase spans
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_PROMPTS = os.environ.get("LOG_PROMPTS", "0") == "1"  # dump full prompts and replies (old behaviour)
+LOG_RATE_LIMIT = float(os.environ.get("LOG_RATE_LIMIT", 10))  # records per second per call site
+LOG_RATE_BURST = int(os.environ.get("LOG_RATE_BURST", 20))
+LOG_SLOW_REQUEST_SECONDS = float(os.environ.get("LOG_SLOW_REQUEST_SECONDS", 10))  # 0 = off
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40)
+
+
+# --- Histograms ---
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def totals(self):
+        """{label values: (sum, count)}"""
+        with self._lock:
+            return {labels: (s[1], s[2]) for labels, s in self._series.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(s[0]), s[1], s[2]) for labels, s in sorted(self._series.items())]
+        for labels, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {count}")
+        return "\n".join(lines)
+
+
+REQUEST_SECONDS = Histogram("ikigai_request_seconds", "Request duration by endpoint and status.",
+                            ("endpoint", "status"))
+PHASE_SECONDS = Histogram("ikigai_phase_seconds", "Time spent in each request phase (sampled).",
+                          ("endpoint", "phase"))
+MODEL_CALL_SECONDS = Histogram("ikigai_model_call_seconds", "Model call duration by route and model.",
+                               ("route", "model"))
+
+
+def render_metrics():
+    """All histograms in the Prometheus text exposition format."""
+    return "\n".join(h.render() for h in (REQUEST_SECONDS, PHASE_SECONDS, MODEL_CALL_SECONDS)) + "\n"
+
+
+# --- Traces and spans ---
+
+class Trace:
+    __slots__ = ("endpoint", "sampled", "started", "spans")
+
+    def __init__(self, endpoint, sampled):
+        self.endpoint = endpoint
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.spans = []  # (phase, seconds)
+
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+def start_trace(endpoint):
+    """Starts the current request's trace (None when metrics are off)."""
+    if not METRICS_ENABLED:
+        return None
+    trace = Trace(endpoint, random.random() < METRICS_SAMPLE_RATE)
+    _current.set(trace)
+    return trace
+
+
+def finish_trace(trace, status):
+    """Records the request total and clears the current trace."""
+    _current.set(None)
+    if trace is None:
+        return
+    elapsed = time.perf_counter() - trace.started
+    REQUEST_SECONDS.observe((trace.endpoint, str(status)), elapsed)
+    if LOG_SLOW_REQUEST_SECONDS and elapsed >= LOG_SLOW_REQUEST_SECONDS:
+        phases = ", ".join(f"{phase}={seconds:.3f}s" for phase, seconds in trace.spans) or "not sampled"
+        log.warning("Slow request %s (%s): %.3fs [%s]", trace.endpoint, status, elapsed, phases)
+
+
+@contextmanager
+def resumed(trace, status=200):
+    """Makes trace current while a streamed body is generated, then records it once the stream ends."""
+    _current.set(trace)
+    try:
+        yield
+    finally:
+        finish_trace(trace, status)
+
+
+@contextmanager
+def span(phase):
+    """Times a phase of the current request (no-op outside a sampled request, e.g. prefetch threads)."""
+    trace = _current.get()
+    if trace is None or not trace.sampled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        trace.spans.append((phase, elapsed))
+        PHASE_SECONDS.observe((trace.endpoint, phase), elapsed)
+
+
+# --- Logging ---
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per call site; suppressed records are counted and reported with the next one let through."""
+
+    def __init__(self, rate=LOG_RATE_LIMIT, burst=LOG_RATE_BURST):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}  # (pathname, lineno) -> [tokens, last, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.rate <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.setdefault(key, [self.burst, now, 0])
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+        return True
+
+
+def get_logger(name):
+    """Child of the 'ikigai' logger, which writes leveled, rate-limited lines to stderr."""
+    root = logging.getLogger("ikigai")
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        handler.addFilter(RateLimitFilter())
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+    return root.getChild(name)
+
+
+log = get_logger("telemetry")
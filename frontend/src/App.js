@@ -1,4 +1,4 @@
-import React, { useState, useCallback, useEffect } from 'react';
+import React, { useState, useCallback, useEffect, useRef } from 'react';
 import FormComponent from './components/FormComponent';
 import PathSelectionComponent from './components/PathSelectionComponent';
 import InteractionComponent from './components/InteractionComponent';
@@ -17,6 +17,7 @@ function App() {
   const [finalSummary, setFinalSummary] = useState(null); // Holds the structured summary object when session finishes
   const [formDataForRetry, setFormDataForRetry] = useState(null); // Store form data if needed for retry/restart
   const [chosenPathName, setChosenPathName] = useState(''); // Store the name of the chosen path
+  const sessionIdRef = useRef(null); // Session id issued by /analyze_form, sent back on every call
 
   // --- API Call Functions ---
 
@@ -28,8 +29,12 @@ function App() {
         method,
         headers: {
           'Content-Type': 'application/json',
+          'Prefer': 'return=minimal', // Lean bodies: no null fields; missing ones read as falsy below
         },
       };
+      if (sessionIdRef.current) {
+        options.headers['X-Session-Id'] = sessionIdRef.current;
+      }
       if (body) {
         options.body = JSON.stringify(body);
       }
@@ -51,6 +56,9 @@ function App() {
       if (data.status !== 'success') {
         throw new Error(data.message || 'API request failed');
       }
+      if (data.session_id) {
+        sessionIdRef.current = data.session_id;
+      }
       setIsLoading(false);
       return data; // Return the payload part of the response
 